@@ -0,0 +1,52 @@
+import zlib
+import numpy as np
+import pandas as pd
+
+from typing import Any
+
+
+# Compact storage helpers shared by the extractors. Dates are stored as
+# int32 day numbers (days since 1970-01-01), repeated strings as
+# categoricals, and long free text as zlib-compressed bytes.
+
+
+def to_day_numbers(dates: pd.Series) -> pd.Series:
+    days = pd.to_datetime(dates, errors="coerce").to_numpy(dtype="datetime64[D]").astype(np.int64)
+    return pd.Series(days.astype(np.int32), index=dates.index)
+
+
+def day_number(date: str) -> int:
+    return int(np.datetime64(date, "D").astype(np.int64))
+
+
+def date_strings(dates: pd.Series) -> pd.Series:
+    """
+    'YYYY-MM-DD' strings for a date column in either storage format.
+    """
+    if pd.api.types.is_integer_dtype(dates):
+        return pd.Series(dates.to_numpy().astype("datetime64[D]").astype(str), index=dates.index)
+    return dates.astype(str)
+
+
+def compress_text(texts: pd.Series) -> pd.Series:
+    return texts.map(lambda text: zlib.compress(text.encode("utf-8")) if isinstance(text, str) else text)
+
+
+def decompress_text(texts: pd.Series) -> pd.Series:
+    return texts.map(lambda text: zlib.decompress(text).decode("utf-8") if isinstance(text, bytes) else text)
+
+
+def memory_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+def memory_report(name: str, df: pd.DataFrame, bytes_before: int) -> dict[str, Any]:
+    bytes_after = memory_bytes(df)
+
+    return {
+        "dataset": name,
+        "rows": len(df),
+        "mb_before": round(bytes_before / 1e6, 3),
+        "mb_after": round(bytes_after / 1e6, 3),
+        "reduction": round(bytes_before / bytes_after, 2) if bytes_after else None,
+    }
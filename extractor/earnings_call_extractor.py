@@ -1,11 +1,31 @@
 import pandas as pd
 
+from typing import Any
+
+from extractor.compact import compress_text, decompress_text, memory_bytes, memory_report
+
 class EarningsCallExtractor:
-    def __init__(self) -> None:
+    def __init__(self, compact: bool = False) -> None:
+        """
+        With `compact`, transcripts are kept zlib-compressed and only
+        decompressed for the quarters a query returns.
+        """
+        self.compact = compact
+
         self.data = pd.read_csv('./data/earnings_transcripts.csv')
         self.data.drop(columns=['transcript_split'], inplace=True)
         self.data.rename(columns=lambda x: x.strip().lower(), inplace=True)
 
+        self._bytes_before = memory_bytes(self.data)
+
+        if compact:
+            self.data['transcript'] = compress_text(self.data['transcript'])
+            for col in ('ticker', 'quarter'):
+                self.data[col] = self.data[col].astype('category')
+
+    def memory_report(self) -> dict[str, Any]:
+        return memory_report("earnings_transcripts", self.data, self._bytes_before)
+
     def get_previous_quarters_transcripts_df(self, ticker: str, current_year: int, current_quarter: str, n_quarters: int = 2) -> pd.DataFrame:
         df = self.data[self.data['ticker'] == ticker].copy()
 
@@ -20,7 +40,13 @@ class EarningsCallExtractor:
         df_filtered = df[df['sort_key'] < current_key]
         df_filtered = df_filtered.sort_values('sort_key', ascending=False).head(n_quarters)
 
-        return df_filtered.drop(columns=['quarter_num', 'sort_key'])
+        df_filtered = df_filtered.drop(columns=['quarter_num', 'sort_key'])
+
+        if self.compact:
+            df_filtered['transcript'] = decompress_text(df_filtered['transcript'])
+            df_filtered = df_filtered.astype({'ticker': object, 'quarter': object})
+
+        return df_filtered
 
     def get_previous_quarters_transcripts_json(self, ticker: str, current_year: int, current_quarter: str, n_quarters: int = 2) -> list[dict]:
         df = self.get_previous_quarters_transcripts_df(ticker, current_year, current_quarter, n_quarters)
@@ -1,18 +1,41 @@
 import pandas as pd
 
+from typing import Any
+
+from extractor.compact import memory_bytes, memory_report
+
 class FinancialStatementExtractor:
-    def __init__(self) -> None:
+    def __init__(self, compact: bool = False) -> None:
+        """
+        With `compact`, the repeated string columns are stored as categoricals.
+        Values stay float64: revenues exceed float32's exact integer range.
+        """
+        self.compact = compact
+
         self.data = pd.read_csv('./data/financial_statement_history.csv')
         self.data.rename(columns=lambda x: x.strip().lower(), inplace=True)
 
+        self._bytes_before = memory_bytes(self.data)
+
+        if compact:
+            for col in ('ticker', 'quarter', 'date', 'metric', 'financial_statement'):
+                if col in self.data.columns:
+                    self.data[col] = self.data[col].astype('category')
+
+    def memory_report(self) -> dict[str, Any]:
+        return memory_report("financial_statements", self.data, self._bytes_before)
+
     def get_tickers(self) -> list[str]:
-        return list(self.data['ticker'].unique())
+        return [str(ticker) for ticker in self.data['ticker'].unique()]
 
     def get_previous_quarters_statements_df(
         self, ticker: str, current_year: int, current_quarter: str, n_quarters: int = 2
     ) -> pd.DataFrame:
         df = self.data[self.data['ticker'] == ticker].copy()
 
+        if self.compact:
+            df = df.astype({col: object for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
+
         quarter_order = {'Q1': 1, 'Q2': 2, 'Q3': 3, 'Q4': 4}
         df['quarter_num'] = df['quarter'].map(quarter_order)
         df['year'] = df['year'].astype(int)
@@ -1,9 +1,49 @@
+import hashlib
+import re
+import zlib
+import numpy as np
 import pandas as pd
+
+from collections import defaultdict
 from typing import Any, List, Dict
 
+from extractor.compact import date_strings, day_number, memory_bytes, memory_report, to_day_numbers
+from extractor.news_index import NewsIndex
+
+
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+def _normalize_text(text: Any) -> str:
+    if not isinstance(text, str):
+        return ""
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def _find(parent: list[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def _union(parent: list[int], i: int, j: int) -> None:
+    # The lower (earlier) index stays the cluster representative.
+    ri, rj = _find(parent, i), _find(parent, j)
+    if ri != rj:
+        parent[max(ri, rj)] = min(ri, rj)
+
 
 class NewsExtractor:
-    def __init__(self) -> None:
+    def __init__(self, compact: bool = False) -> None:
+        """
+        With `compact`, ticker, headline and summary are stored as categoricals
+        (syndicated articles repeat the same text across tickers) and dates as
+        int32 day numbers; every extract method still returns 'YYYY-MM-DD'
+        date strings.
+        """
+        self.compact = compact
+
         self.data = pd.read_csv("./data/news_history.csv")
         self.data["date"] = pd.to_datetime(self.data["datetime"], errors="coerce")
         self.data.sort_values("date", ascending=True, inplace=True)
@@ -12,17 +52,43 @@ class NewsExtractor:
         self.data.drop(columns=drop_cols, inplace=True, errors="ignore")
         self.data["date"] = self.data["date"].dt.strftime("%Y-%m-%d")
 
+        self._bytes_before = memory_bytes(self.data)
+
+        if compact:
+            self.data["date"] = to_day_numbers(self.data["date"])
+            for col in ("ticker", "headline", "summary"):
+                self.data[col] = self.data[col].astype("category")
+
+        self._indexes: dict[str, NewsIndex] = {}
+
+    def memory_report(self) -> dict[str, Any]:
+        return memory_report("news", self.data, self._bytes_before)
+
+    def _date(self, date: str) -> str | int:
+        return day_number(date) if self.compact else date
+
+    def _restore(self, df: pd.DataFrame) -> pd.DataFrame:
+        if not self.compact:
+            return df
+
+        df = df.copy()
+        df["date"] = date_strings(df["date"])
+        for col in ("ticker", "headline", "summary"):
+            df[col] = df[col].astype(object)
+
+        return df
+
     def show_universe(self, start_date: str | None = None, end_date: str | None = None, min_cnt: int | None = 50) -> list[dict[str, Any]]:
-        summary = self.data.copy()
+        summary = self.data
         
         if start_date:
-            summary = summary[summary['date'] >= start_date]
+            summary = summary[summary['date'] >= self._date(start_date)]
         
         if end_date:
-            summary = summary[summary['date'] <= end_date]        
+            summary = summary[summary['date'] <= self._date(end_date)]        
         
         summary = (
-            summary.groupby("ticker")["date"]
+            summary.groupby("ticker", observed=True)["date"]
             .agg(
                 start_date="min",
                 end_date="max",
@@ -34,6 +100,11 @@ class NewsExtractor:
         if min_cnt:
             summary = summary[summary['days'] >= min_cnt]
 
+        if self.compact:
+            summary['ticker'] = summary['ticker'].astype(str)
+            summary['start_date'] = date_strings(summary['start_date'])
+            summary['end_date'] = date_strings(summary['end_date'])
+
         result = summary.to_dict("records")
 
         return result
@@ -50,10 +121,10 @@ class NewsExtractor:
         """
         df = self.data
         df = df[df["ticker"] == ticker]
-        df = df[df["date"] >= start_date]
-        df = df[df["date"] <= end_date]
+        df = df[df["date"] >= self._date(start_date)]
+        df = df[df["date"] <= self._date(end_date)]
 
-        return df
+        return self._restore(df)
 
     def extract_news_json(
         self,
@@ -85,10 +156,10 @@ class NewsExtractor:
         Return a DataFrame with news for all supplied tickers over a date window.
         """
         df = self.data[self.data["ticker"].isin(tickers)]
-        df = df[df["date"] >= start_date]
-        df = df[df["date"] <= end_date]
+        df = df[df["date"] >= self._date(start_date)]
+        df = df[df["date"] <= self._date(end_date)]
         
-        return df
+        return self._restore(df)
 
     def extract_news_json_for_tickers(
         self,
@@ -106,4 +177,136 @@ class NewsExtractor:
             grp = grp[["date", "headline", "summary"]]
             result[ticker_symbol] = grp.to_dict(orient="records")
 
-        return result
\ No newline at end of file
+        return result
+
+    def get_news_index(self, ticker: str) -> NewsIndex:
+        """
+        BM25 index over all of `ticker`'s news, built on first use and reused
+        for every later query.
+        """
+        if ticker not in self._indexes:
+            self._indexes[ticker] = NewsIndex(self._restore(self.data[self.data["ticker"] == ticker]))
+        return self._indexes[ticker]
+
+    def retrieve_news_json(
+        self,
+        ticker: str,
+        query: str,
+        start_date: str | None = None,
+        end_date: str | None = None,
+        top_k: int | None = None,
+        token_budget: int | None = None,
+        include_ticker: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Like extract_news_json, but only the `top_k` articles most relevant to
+        `query` that fit within `token_budget` estimated tokens.
+        """
+        records = self.get_news_index(ticker).search(query, start_date, end_date, top_k, token_budget)
+        cols = ["date", "headline", "summary"]
+
+        if include_ticker:
+            cols.append("ticker")
+
+        return [{col: record[col] for col in cols} for record in records]
+
+    @staticmethod
+    def deduplicate_news(
+        records: list[dict[str, Any]],
+        threshold: float = 0.8,
+        num_perm: int = 64,
+        bands: int = 16,
+        shingle_size: int = 3,
+        seed: int = 42,
+    ) -> list[int]:
+        """
+        Cluster exact and near-duplicate news items by headline + summary.
+
+        Exact duplicates are matched on a hash of the normalised text. Near
+        duplicates are found with MinHash over word shingles, using LSH
+        banding (`bands` bands of `num_perm // bands` rows) to pick candidate
+        pairs, and are merged when their estimated Jaccard similarity is at
+        least `threshold`. Only items of the same ticker are merged: sentiment
+        is scored for the ticker named in the prompt, so it cannot be shared
+        between tickers.
+
+        Returns, for every record, the index of its cluster representative
+        (the first member, i.e. the earliest item when records are sorted by
+        date); representatives map to themselves.
+        """
+        n = len(records)
+        parent = list(range(n))
+
+        if n == 0:
+            return parent
+
+        texts = [
+            _normalize_text(f"{record.get('headline', '')} {record.get('summary', '')}")
+            for record in records
+        ]
+        groups = [str(record.get("ticker", "")) for record in records]
+
+        exact = {}
+        for i, (group, text) in enumerate(zip(groups, texts)):
+            key = (group, hashlib.sha1(text.encode("utf-8")).hexdigest())
+            if key in exact:
+                _union(parent, exact[key], i)
+            else:
+                exact[key] = i
+
+        rng = np.random.default_rng(seed)
+        a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        rows = num_perm // bands
+
+        # Only cluster representatives from the exact pass need signatures.
+        unique = sorted(exact.values())
+        signatures = np.empty((len(unique), num_perm), dtype=np.uint64)
+
+        for row, i in enumerate(unique):
+            words = texts[i].split()
+            shingles = {
+                " ".join(words[k:k + shingle_size])
+                for k in range(max(len(words) - shingle_size + 1, 1))
+            }
+            hashes = np.array([zlib.crc32(sh.encode("utf-8")) for sh in shingles], dtype=np.uint64) % _MERSENNE_PRIME
+            signatures[row] = ((np.outer(hashes, a) + b) % _MERSENNE_PRIME).min(axis=0)
+
+        buckets = defaultdict(list)
+        for row, i in enumerate(unique):
+            for band in range(bands):
+                band_key = signatures[row, band * rows:(band + 1) * rows].tobytes()
+                buckets[(groups[i], band, band_key)].append(row)
+
+        checked = set()
+        for members in buckets.values():
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    pair = (members[x], members[y])
+                    if pair in checked:
+                        continue
+                    checked.add(pair)
+
+                    similarity = np.mean(signatures[pair[0]] == signatures[pair[1]])
+                    if similarity >= threshold:
+                        _union(parent, unique[pair[0]], unique[pair[1]])
+
+        return [_find(parent, i) for i in range(n)]
+
+    def extract_news_json_deduplicated(
+        self,
+        tickers: list[str],
+        start_date: str | None = None,
+        end_date: str | None = None,
+        threshold: float = 0.8,
+    ) -> tuple[List[Dict[str, Any]], list[int]]:
+        """
+        News for all supplied tickers as `{ticker, date, headline, summary}`
+        records, together with the cluster representative index of each record
+        (see `deduplicate_news`).
+        """
+        df = self.extract_news_for_tickers(tickers, start_date, end_date)
+        records = df[["ticker", "date", "headline", "summary"]].to_dict(orient="records")
+        representatives = self.deduplicate_news(records, threshold=threshold)
+
+        return records, representatives
@@ -0,0 +1,118 @@
+import math
+import re
+import numpy as np
+import pandas as pd
+
+from collections import Counter, defaultdict
+from typing import Any
+
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have",
+    "in", "is", "it", "its", "of", "on", "or", "that", "the", "to", "was", "were",
+    "will", "with",
+}
+
+
+def tokenize(text: Any) -> list[str]:
+    if not isinstance(text, str):
+        return []
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in _STOPWORDS]
+
+
+def estimate_tokens(record: dict[str, Any]) -> int:
+    # Roughly four characters per token for English text.
+    return math.ceil(len(str(record)) / 4)
+
+
+class NewsIndex:
+    """
+    Okapi BM25 index over the headline and summary of one ticker's news.
+    """
+
+    def __init__(self, df: pd.DataFrame, k1: float = 1.5, b: float = 0.75) -> None:
+        self.records = df[["date", "headline", "summary", "ticker"]].to_dict(orient="records")
+        self.dates = np.array([str(record["date"]) for record in self.records])
+        self.k1 = k1
+        self.b = b
+
+        self.postings: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+        self.doc_lengths = np.zeros(len(self.records), dtype=float)
+
+        postings = defaultdict(lambda: ([], []))
+        for i, record in enumerate(self.records):
+            tokens = tokenize(record["headline"]) + tokenize(record["summary"])
+            self.doc_lengths[i] = len(tokens)
+
+            for term, tf in Counter(tokens).items():
+                postings[term][0].append(i)
+                postings[term][1].append(tf)
+
+        for term, (docs, tfs) in postings.items():
+            self.postings[term] = (np.array(docs, dtype=np.int64), np.array(tfs, dtype=float))
+
+        self.avg_doc_length = float(self.doc_lengths.mean()) if len(self.records) else 0.0
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def score(self, query: str) -> np.ndarray:
+        n = len(self.records)
+        scores = np.zeros(n, dtype=float)
+
+        if n == 0:
+            return scores
+
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lengths / max(self.avg_doc_length, 1e-9))
+
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+
+            docs, tfs = self.postings[term]
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+
+        return scores
+
+    def search(
+        self,
+        query: str,
+        start_date: str | None = None,
+        end_date: str | None = None,
+        top_k: int | None = None,
+        token_budget: int | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Articles between `start_date` and `end_date` ranked by BM25 relevance
+        to `query`, keeping at most `top_k` of them and as many as fit within
+        `token_budget` estimated prompt tokens. Articles sharing no term with
+        the query are dropped. Returned oldest first.
+        """
+        scores = self.score(query)
+
+        mask = scores > 0
+        if start_date:
+            mask &= self.dates >= start_date
+        if end_date:
+            mask &= self.dates <= end_date
+
+        candidates = np.flatnonzero(mask)
+        # Stable sort keeps date order among equally relevant articles.
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+
+        selected = []
+        used_tokens = 0
+
+        for i in ranked:
+            if top_k is not None and len(selected) >= top_k:
+                break
+
+            tokens = estimate_tokens(self.records[i])
+            if token_budget is not None and used_tokens + tokens > token_budget:
+                continue
+
+            selected.append(i)
+            used_tokens += tokens
+
+        return [self.records[i] for i in sorted(selected)]
@@ -1,24 +1,59 @@
 import datetime
+import numpy as np
 import pandas as pd
 
 from typing import Any
 
+from extractor.compact import date_strings, day_number, memory_bytes, memory_report, to_day_numbers
+
 class PriceExtractor:
-    def __init__(self):
+    def __init__(self, compact: bool = False):
+        """
+        With `compact`, tickers are stored as a categorical, dates as int32 day
+        numbers and prices as float32; every extract method still returns
+        'YYYY-MM-DD' date strings.
+        """
+        self.compact = compact
+
         self.data = pd.read_csv("./data/stock_price_history.csv")        
         self.data['date'] = pd.to_datetime(self.data['date'], errors='coerce')
         self.data.sort_values('date', ascending=True, inplace=True)
         self.data.drop(columns=['uuid', 'open', 'high', 'low', 'stock_splits', 'dividends'], inplace=True)
         self.data['date'] = self.data['date'].dt.strftime("%Y-%m-%d")
 
+        self._bytes_before = memory_bytes(self.data)
+
+        if compact:
+            self.data['date'] = to_day_numbers(self.data['date'])
+            self.data['ticker'] = self.data['ticker'].astype('category')
+            self.data['close'] = self.data['close'].astype(np.float32)
+            self.data['volume'] = pd.to_numeric(self.data['volume'], downcast='unsigned')
+
+    def memory_report(self) -> dict[str, Any]:
+        return memory_report("price", self.data, self._bytes_before)
+
+    def _date(self, date: str) -> str | int:
+        return day_number(date) if self.compact else date
+
+    def _restore(self, df: pd.DataFrame) -> pd.DataFrame:
+        if not self.compact:
+            return df
+
+        df = df.copy()
+        df['date'] = date_strings(df['date'])
+        df['ticker'] = df['ticker'].astype(str)
+        df['close'] = df['close'].astype(np.float64)
+
+        return df
+
     def ticker_statistics(self, ticker: str, start_date: str, end_date: str) -> dict[Any]:
         mask = (
             (self.data["ticker"] == ticker)
-            & (self.data["date"] >= start_date)
-            & (self.data["date"] <= end_date)
+            & (self.data["date"] >= self._date(start_date))
+            & (self.data["date"] <= self._date(end_date))
         )
 
-        df = self.data.loc[mask, ["date", 'close']].sort_values("date").copy()
+        df = self._restore(self.data.loc[mask, ["date", "ticker", 'close']]).sort_values("date").copy()
 
         if df.empty:
             raise ValueError(f"No data for {ticker} between {start_date} and {end_date}")
@@ -48,16 +83,16 @@ class PriceExtractor:
         }
     
     def show_universe(self, start_date: str | None = None, end_date: str | None = None, min_cnt: int | None = 50) -> list[dict[str, Any]]:
-        summary = self.data.copy()
+        summary = self.data
         
         if start_date:
-            summary = summary[summary['date'] >= start_date]
+            summary = summary[summary['date'] >= self._date(start_date)]
         
         if end_date:
-            summary = summary[summary['date'] <= end_date]        
+            summary = summary[summary['date'] <= self._date(end_date)]        
         
         summary = (
-            summary.groupby("ticker")["date"]
+            summary.groupby("ticker", observed=True)["date"]
             .agg(
                 start_date="min",
                 end_date="max",
@@ -69,20 +104,25 @@ class PriceExtractor:
         if min_cnt:
             summary = summary[summary['days'] >= min_cnt]
 
+        if self.compact:
+            summary['ticker'] = summary['ticker'].astype(str)
+            summary['start_date'] = date_strings(summary['start_date'])
+            summary['end_date'] = date_strings(summary['end_date'])
+
         result = summary.to_dict("records")
 
         return result
 
     def extract_ticker_price(self, ticker: str, start_date: str, end_date: str):
         df = self.data[self.data['ticker'] == ticker]
-        df = df[(df["date"] >= start_date) & (df["date"] <= end_date)]
+        df = df[(df["date"] >= self._date(start_date)) & (df["date"] <= self._date(end_date))]
 
-        return df
+        return self._restore(df)
     
     def extract_tickers_price(self, tickers: list[str], start_date: str, end_date: str):
         df = self.data[self.data['ticker'].isin(tickers)]
-        df = df[(df["date"] >= start_date) & (df["date"] <= end_date)]
-        return df
+        df = df[(df["date"] >= self._date(start_date)) & (df["date"] <= self._date(end_date))]
+        return self._restore(df)
     
     def extract_ticker_price_json(self, 
                            ticker: str, 
@@ -97,8 +137,7 @@ class PriceExtractor:
                                    start_date: str, 
                                    end_date: str) -> dict[str, list[dict[str, Any]]]:
         
-        df = self.data[self.data['ticker'].isin(tickers)]
-        df = df[(df["date"] >= start_date) & (df["date"] <= end_date)]
+        df = self.extract_tickers_price(tickers, start_date, end_date)
         
         result = {}
         
@@ -0,0 +1,198 @@
+import numpy as np
+import pandas as pd
+
+from typing import Any
+
+from numpy.lib.stride_tricks import sliding_window_view
+
+from extractor.compact import date_strings
+
+
+def _day_numbers(dates: Any) -> np.ndarray:
+    return np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+
+
+class PriceShapeIndex:
+    """
+    Vectorised nearest-neighbour index over every ticker's sliding windows of
+    daily closes, used as a non-LLM baseline and candidate shortlist for
+    ticker identification.
+
+    `metric="correlation"` compares z-normalised windows (shape only, higher
+    is closer); `metric="euclidean"` compares raw closes (shape and price
+    level, lower is closer).
+    """
+
+    def __init__(self, price_extractor, window_size: int = 30, metric: str = "correlation") -> None:
+        if metric not in ("correlation", "euclidean"):
+            raise ValueError(f"Invalid metric: {metric}")
+
+        self.price_extractor = price_extractor
+        self.window_size = window_size
+        self.metric = metric
+
+        data = price_extractor.data[["ticker", "date", "close"]].sort_values(["ticker", "date"])
+
+        windows, starts, ends, tickers, counts = [], [], [], [], []
+
+        for ticker, grp in data.groupby("ticker", sort=True, observed=True):
+            closes = grp["close"].to_numpy(dtype=np.float64)
+            if len(closes) < window_size:
+                continue
+
+            days = _day_numbers(date_strings(grp["date"]).to_numpy())
+
+            windows.append(sliding_window_view(closes, window_size))
+            starts.append(days[:len(days) - window_size + 1])
+            ends.append(days[window_size - 1:])
+            tickers.append(ticker)
+            counts.append(len(closes) - window_size + 1)
+
+        self.tickers = np.array(tickers)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64)
+        self.starts = np.concatenate(starts)
+        self.ends = np.concatenate(ends)
+        self.windows = self._prepare(np.concatenate(windows))
+        self.sq_norms = (self.windows ** 2).sum(axis=1)
+
+    def _prepare(self, windows: np.ndarray) -> np.ndarray:
+        windows = np.asarray(windows, dtype=np.float64)
+
+        if self.metric == "correlation":
+            # Scaled so that the dot product of two windows is their Pearson correlation.
+            std = windows.std(axis=1, keepdims=True)
+            windows = (windows - windows.mean(axis=1, keepdims=True)) / np.where(std > 0, std, 1)
+            windows = windows / np.sqrt(self.window_size)
+
+        return windows.astype(np.float32)
+
+    def query(
+        self,
+        windows: np.ndarray,
+        start_dates: Any = None,
+        end_dates: Any = None,
+        k: int = 5,
+        batch_size: int = 512,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Top-`k` tickers for each row of `windows` (shape m x window_size),
+        scoring each ticker by its best-matching window. When `start_dates`
+        and `end_dates` are given, reference windows overlapping a query's
+        dates are ignored, so a series is never matched against itself.
+
+        Returns `(tickers, scores)`, both of shape m x k, best first; scores
+        are correlations or Euclidean distances depending on `metric`.
+        """
+        queries = self._prepare(windows)
+        exclude = start_dates is not None and end_dates is not None
+
+        if exclude:
+            start_dates = _day_numbers(start_dates)
+            end_dates = _day_numbers(end_dates)
+
+        k = min(k, len(self.tickers))
+        top_tickers = np.empty((len(queries), k), dtype=self.tickers.dtype)
+        top_scores = np.empty((len(queries), k), dtype=np.float64)
+
+        for lo in range(0, len(queries), batch_size):
+            batch = queries[lo:lo + batch_size]
+
+            # Higher is better for both metrics; distances are negated here.
+            if self.metric == "correlation":
+                scores = batch @ self.windows.T
+            else:
+                sq = (batch ** 2).sum(axis=1, keepdims=True) + self.sq_norms - 2 * (batch @ self.windows.T)
+                scores = -np.sqrt(np.maximum(sq, 0))
+
+            if exclude:
+                overlap = (
+                    (self.starts[None, :] <= end_dates[lo:lo + batch_size, None])
+                    & (self.ends[None, :] >= start_dates[lo:lo + batch_size, None])
+                )
+                scores = np.where(overlap, -np.inf, scores)
+
+            per_ticker = np.maximum.reduceat(scores, self.offsets, axis=1)
+            order = np.argsort(-per_ticker, axis=1, kind="stable")[:, :k]
+
+            top_tickers[lo:lo + batch_size] = self.tickers[order]
+            top_scores[lo:lo + batch_size] = np.take_along_axis(per_ticker, order, axis=1)
+
+        if self.metric == "euclidean":
+            top_scores = -top_scores
+
+        return top_tickers, top_scores
+
+    def _ticker_windows(self, ticker: str, start_date: str, end_date: str) -> pd.DataFrame:
+        df = self.price_extractor.extract_ticker_price(ticker, start_date, end_date)
+        df = df[["date", "close"]].sort_values("date")
+
+        dates = df["date"].astype(str).to_numpy()
+        closes = df["close"].to_numpy(dtype=np.float64)
+
+        # Same windows as LLMForFinance.estimate_stock_ticker: the window
+        # for step i covers rows i - window_size .. i - 1.
+        n = len(closes) - self.window_size
+        if n <= 0:
+            return pd.DataFrame(columns=["start_date", "last_date", "last_close", "window"])
+
+        return pd.DataFrame({
+            "start_date": dates[:n],
+            "last_date": dates[self.window_size - 1:self.window_size - 1 + n],
+            "last_close": closes[self.window_size - 1:self.window_size - 1 + n],
+            "window": list(sliding_window_view(closes, self.window_size)[:n]),
+        })
+
+    def shortlist(
+        self,
+        window: list[dict[str, Any]],
+        k: int = 5,
+        exclude_overlap: bool = True,
+    ) -> list[str]:
+        """
+        Candidate tickers for one `[{date, close}, ...]` price window.
+        """
+        closes = np.array([[row["close"] for row in window]])
+        dates = ([window[0]["date"]], [window[-1]["date"]]) if exclude_overlap else (None, None)
+
+        tickers, _ = self.query(closes, *dates, k=k)
+        return [str(t) for t in tickers[0]]
+
+    def estimate_tickers(
+        self,
+        tickers: list[str],
+        start_date: str,
+        end_date: str,
+        k: int = 5,
+        exclude_overlap: bool = True,
+    ) -> pd.DataFrame:
+        """
+        Baseline for LLMForFinance.estimate_tickers: for every window of every
+        ticker, in one batched query, the most similar ticker and the top-`k`
+        candidates, plus the 1-based rank of the true ticker (None if outside
+        the top `k`).
+        """
+        frames = []
+        for ticker in tickers:
+            df = self._ticker_windows(ticker, start_date, end_date)
+            if not df.empty:
+                df["ticker"] = ticker
+                frames.append(df)
+
+        if not frames:
+            return pd.DataFrame(columns=["last_date", "last_close", "ticker", "estimated_ticker", "score", "candidates", "true_rank"])
+
+        df = pd.concat(frames, ignore_index=True)
+
+        dates = (df["start_date"].to_numpy(), df["last_date"].to_numpy()) if exclude_overlap else (None, None)
+        candidates, scores = self.query(np.stack(df["window"].to_numpy()), *dates, k=k)
+
+        df["estimated_ticker"] = candidates[:, 0]
+        df["score"] = scores[:, 0]
+        df["candidates"] = [[str(t) for t in row] for row in candidates]
+
+        hits = candidates == df["ticker"].to_numpy()[:, None]
+        df["true_rank"] = [int(np.argmax(row)) + 1 if row.any() else None for row in hits]
+
+        df["last_date"] = pd.to_datetime(df["last_date"])
+
+        return df.drop(columns=["window", "start_date"])
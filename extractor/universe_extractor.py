@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+
+from typing import Any
+
+from extractor.compact import date_strings
+
+
+class UniverseExtractor:
+    """
+    Per-ticker coverage across price, news, financial statements and earnings
+    call transcripts.
+
+    Coverage (the sorted distinct dates each source has for a ticker) is built
+    once per dataset version, so universe queries only binary-search small
+    per-ticker arrays instead of copying and grouping the full datasets.
+    Query results are memoized by their parameters.
+    """
+
+    def __init__(
+        self,
+        price_extractor=None,
+        news_extractor=None,
+        financial_statement_extractor=None,
+        earnings_extractor=None,
+    ) -> None:
+        self.price_extractor = price_extractor
+        self.news_extractor = news_extractor
+        self.financial_statement_extractor = financial_statement_extractor
+        self.earnings_extractor = earnings_extractor
+
+        self._coverage: dict[str, dict[str, np.ndarray]] | None = None
+        self._version: tuple | None = None
+        self._cache: dict[tuple, list[dict[str, Any]]] = {}
+
+    def _sources(self) -> dict[str, Any]:
+        sources = {
+            "price": self.price_extractor,
+            "news": self.news_extractor,
+            "quarters": self.financial_statement_extractor,
+            "transcripts": self.earnings_extractor,
+        }
+        return {name: extractor for name, extractor in sources.items() if extractor is not None}
+
+    def dataset_version(self) -> tuple:
+        """
+        Cheap identity of the loaded datasets; changes whenever an extractor
+        reloads or replaces its frame.
+        """
+        return tuple(
+            (name, id(extractor.data), len(extractor.data))
+            for name, extractor in self._sources().items()
+        )
+
+    @staticmethod
+    def _dates_by_ticker(df: pd.DataFrame, per_quarter: bool = False) -> dict[str, np.ndarray]:
+        """
+        Sorted distinct dates per ticker. With `per_quarter`, one date (the
+        latest) per distinct (year, quarter) instead, so quarters whose
+        statement dates coincide are still counted separately, as in
+        FinancialStatementExtractor.get_previous_quarters_statements_df.
+        """
+        keys = ["ticker", "year", "quarter"] if per_quarter else ["ticker"]
+
+        dates = df[keys + ["date"]].drop_duplicates()
+        dates["date"] = pd.to_datetime(date_strings(dates["date"]).str.strip().str[:10], errors="coerce").dt.strftime("%Y-%m-%d")
+        dates = dates.dropna()
+
+        if per_quarter:
+            dates = dates.astype({"quarter": str}).groupby(keys, observed=True)["date"].max().reset_index()
+        else:
+            dates = dates.drop_duplicates()
+
+        return {
+            ticker: np.sort(grp["date"].to_numpy().astype(str))
+            for ticker, grp in dates.groupby("ticker", observed=True)
+        }
+
+    def coverage(self) -> dict[str, dict[str, np.ndarray]]:
+        """
+        Return `{source: {ticker: sorted array of distinct dates}}`, rebuilt only
+        when the dataset version changes.
+        """
+        version = self.dataset_version()
+
+        if self._coverage is not None and self._version == version:
+            return self._coverage
+
+        coverage = {}
+        for name, extractor in self._sources().items():
+            coverage[name] = self._dates_by_ticker(extractor.data, per_quarter=name == "quarters")
+
+        self._coverage = coverage
+        self._version = version
+        self._cache.clear()
+
+        return coverage
+
+    @staticmethod
+    def _count_in_range(dates: np.ndarray, start_date: str | None, end_date: str | None) -> tuple[int, str | None, str | None]:
+        lo = np.searchsorted(dates, start_date, side="left") if start_date else 0
+        hi = np.searchsorted(dates, end_date, side="right") if end_date else len(dates)
+
+        if hi <= lo:
+            return 0, None, None
+
+        return int(hi - lo), str(dates[lo]), str(dates[hi - 1])
+
+    def show_universe(
+        self,
+        start_date: str | None = None,
+        end_date: str | None = None,
+        min_price_days: int | None = None,
+        min_news_days: int | None = None,
+        min_quarters: int | None = None,
+        min_transcripts: int | None = None,
+    ) -> list[dict[str, Any]]:
+        """
+        Tickers with at least `min_price_days` trading days, `min_news_days` news
+        days, `min_quarters` financial statement quarters and `min_transcripts`
+        earnings calls between `start_date` and `end_date`. A threshold of None
+        leaves that source unconstrained; each record lists the coverage of
+        every loaded source.
+        """
+        minimums = {
+            "price": min_price_days,
+            "news": min_news_days,
+            "quarters": min_quarters,
+            "transcripts": min_transcripts,
+        }
+
+        coverage = self.coverage()
+
+        for name, minimum in minimums.items():
+            if minimum is not None and name not in coverage:
+                raise ValueError(f"No {name} extractor supplied to filter on")
+
+        key = (self._version, start_date, end_date, *minimums.values())
+        if key in self._cache:
+            # Records are copied out so callers cannot alter the memoized answer.
+            return [dict(record) for record in self._cache[key]]
+
+        tickers = sorted(set().union(*(set(dates) for dates in coverage.values()))) if coverage else []
+        empty = np.array([], dtype=str)
+
+        result = []
+        for ticker in tickers:
+            record = {"ticker": ticker}
+            keep = True
+
+            for name, dates_by_ticker in coverage.items():
+                count, first, last = self._count_in_range(dates_by_ticker.get(ticker, empty), start_date, end_date)
+
+                record[f"{name}_start_date"] = first
+                record[f"{name}_end_date"] = last
+                record[f"{name}_days" if name in ("price", "news") else name] = count
+
+                if minimums[name] is not None and count < minimums[name]:
+                    keep = False
+
+            if keep:
+                result.append(record)
+
+        self._cache[key] = result
+
+        return [dict(record) for record in result]
+
+    def get_tickers(
+        self,
+        start_date: str | None = None,
+        end_date: str | None = None,
+        min_price_days: int | None = None,
+        min_news_days: int | None = None,
+        min_quarters: int | None = None,
+        min_transcripts: int | None = None,
+    ) -> list[str]:
+        universe = self.show_universe(start_date, end_date, min_price_days, min_news_days, min_quarters, min_transcripts)
+        return [record["ticker"] for record in universe]
@@ -1,4 +1,11 @@
+import re
+
+from dataclasses import dataclass
 from enum import Enum
+from string import Formatter
+from typing import Any, Callable
+
+from .parsing import parse_earnings, parse_price, parse_sentiment, parse_ticker
 
 class LLMTemplate:
     PRICE = "PRICE"
@@ -168,7 +175,7 @@ Each item is a dictionary with:
 ```json
 {prev_earnings_call}
 
-3. **News Sentiment Articles** – current quarter
+3. **News Sentiment Articles** – current quarter, limited to the articles most relevant to earnings
 Each item contains:
 - `"ticker"` (str, company ticker)
 - `"date"` (str, YYYY-MM-DD)
@@ -199,4 +206,210 @@ Example:
 ###EARNINGS### 52480000 | 0.88
 
 Do not include commentary or explanations after this line.
-"""
\ No newline at end of file
+"""
+
+
+# Cache-friendly layout (cache_friendly_prompts): the instructions go first,
+# as a stable prefix sent in the system message, and the per-request data
+# last, so endpoints with automatic prompt-prefix caching can reuse the
+# prefix. Both parts are cut from the templates above, so the two layouts
+# cannot drift apart.
+
+_DATA_LABELS = {
+    "price_data": "Price data",
+    "sentiment_data": "Sentiment data",
+    "news_data": "News data",
+    "prev_financials": "Historical Financial Statements",
+    "prev_earnings_call": "Previous Quarter's Earnings Call Transcript",
+}
+
+_DATA_BLOCK = re.compile(r"```json\n\{(\w+)\}\n")
+
+
+def _cache_friendly_layout(template: str, rewording: dict[str, str]) -> tuple[str, str]:
+    """
+    Split `template` into an instruction prefix (the template without its
+    ```json data blocks) and a data template holding those blocks, labelled
+    and in order. `rewording` replaces the phrases that point at where the
+    data sits ("Below is", "the above data"); each must occur exactly once.
+    """
+    fields = _DATA_BLOCK.findall(template)
+    prefix = _DATA_BLOCK.sub("", template)
+
+    for old, new in rewording.items():
+        if prefix.count(old) != 1:
+            raise ValueError(f"Expected {old!r} exactly once in the template")
+        prefix = prefix.replace(old, new)
+
+    template_fields = {name for _, name, _, _ in Formatter().parse(template) if name}
+    if set(fields) != template_fields:
+        raise ValueError(f"Template fields {sorted(template_fields)} are not all in ```json blocks")
+
+    prefix = re.sub(r"\n{3,}", "\n\n", prefix).strip()
+    data_template = "\n\n".join(f"{_DATA_LABELS[field]}:\n```json\n{{{field}}}\n```" for field in fields)
+
+    return prefix, data_template
+
+
+PRICE_PREFIX, PRICE_DATA_TEMPLATE = _cache_friendly_layout(PRICE_TEMPLATE, {
+    "Below is": "You will be given",
+    "in the above data": "in that data",
+})
+
+PRICE_SENTIMENT_PREFIX, PRICE_SENTIMENT_DATA_TEMPLATE = _cache_friendly_layout(PRICE_SENTIMENT_TEMPLATE, {
+    "Below is": "You will be given",
+    "You are also provided with": "You will also be given",
+    "only on the information above": "only on that information",
+})
+
+NEWS_PREFIX, NEWS_DATA_TEMPLATE = _cache_friendly_layout(NEWS_TEMPLATE, {
+    "Below is": "You will be given",
+    "the article above": "the article given",
+})
+
+TICKER_PREFIX, TICKER_DATA_TEMPLATE = _cache_friendly_layout(TICKER_TEMPLATE, {
+    "Below is window": "You will be given a window",
+})
+
+EARNINGS_PREFIX, EARNINGS_DATA_TEMPLATE = _cache_friendly_layout(EARNINGS_TEMPLATE, {
+    "based on the provided data": "based on the data provided after these instructions",
+    "Using the datasets above:": "Using the datasets:",
+})
+
+EARNINGS_NEWS_QUERY = (
+    "earnings revenue sales guidance outlook forecast eps profit income margin "
+    "quarter quarterly results beat miss estimates growth demand"
+)
+
+OUTPUT_FORMATS = {
+    LLMTemplate.PRICE: "###!PRICE!### <predicted_close_price>",
+    LLMTemplate.PRICE_NEWS: "###!PRICE!### <predicted_close_price>",
+    LLMTemplate.NEWS: "###!SENTIMENT!### <score_integer> | <confidence: High/Medium/Low> | <reason>",
+    LLMTemplate.ESTIMATE_TICKER: "###!TICKER!### <uppercase_ticker_symbol>",
+    LLMTemplate.ESTIMATE_EARNINGS: "###EARNINGS### <estimated_revenue_in_thousands> | <estimated_eps>",
+}
+
+PRICE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "price": {"type": "number", "exclusiveMinimum": 0},
+    },
+    "required": ["price"],
+}
+
+SENTIMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "integer", "minimum": 1, "maximum": 10},
+        "confidence": {"type": "string", "enum": ["High", "Medium", "Low"]},
+        "reason": {"type": "string"},
+    },
+    "required": ["score", "confidence", "reason"],
+}
+
+TICKER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "ticker": {"type": "string", "pattern": "[A-Z]{1,5}"},
+    },
+    "required": ["ticker"],
+}
+
+EARNINGS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "revenue": {"type": "integer", "minimum": 0},
+        "eps": {"type": "number"},
+    },
+    "required": ["revenue", "eps"],
+}
+
+OUTPUT_SCHEMAS = {
+    LLMTemplate.PRICE: PRICE_SCHEMA,
+    LLMTemplate.PRICE_NEWS: PRICE_SCHEMA,
+    LLMTemplate.NEWS: SENTIMENT_SCHEMA,
+    LLMTemplate.ESTIMATE_TICKER: TICKER_SCHEMA,
+    LLMTemplate.ESTIMATE_EARNINGS: EARNINGS_SCHEMA,
+}
+
+JSON_OUTPUT_INSTRUCTION = """
+
+OUTPUT FORMAT OVERRIDE:
+Ignore the output format given above. Respond with a single JSON object and nothing else,
+matching this JSON schema:
+{schema}
+"""
+
+PACKED_SAMPLES_INSTRUCTION = """
+
+MULTIPLE SAMPLES:
+Produce {n} independent alternative answers, as if asked {n} separate times, varying them according to
+your genuine uncertainty. Output each answer on its own line in the format below, and nothing else:
+{output_format}
+"""
+
+PACKED_JSON_INSTRUCTION = """
+
+OUTPUT FORMAT OVERRIDE:
+Ignore the output format given above. Produce {n} independent alternative answers, as if asked {n}
+separate times, varying them according to your genuine uncertainty. Respond with a single JSON object
+{{"samples": [...]}} and nothing else, where each element of "samples" matches this JSON schema:
+{schema}
+"""
+
+TICKER_CANDIDATES_HINT = """
+
+A price-shape similarity search over the stock universe suggests these candidate tickers, most similar first:
+{candidates}
+Treat them as a shortlist, but choose a different ticker if the data clearly fits it better.
+"""
+
+REPAIR_TEMPLATE = """Your previous answer could not be used ({error}).
+
+Previous answer:
+{answer}
+
+Rewrite it so that it follows exactly this format and contains nothing else. Keep your original
+answer, changing only what is needed to fix the error above (for example, bring an out-of-range value
+within the allowed range):
+{output_format}
+"""
+
+JSON_REPAIR_FORMAT = """A single JSON object matching this JSON schema:
+{schema}"""
+
+
+SYSTEM_PROMPT = "You are a professional financial analyst."
+
+@dataclass(frozen=True)
+class TaskSpec:
+    """
+    Everything needed to prompt for and parse one kind of task. Specs are
+    immutable and passed explicitly, so one LLMForFinance instance can run
+    different tasks concurrently without sharing a mutable active template.
+
+    `template` is the single-message prompt; `prefix` and `data_template`
+    are its cache-friendly layout (see _cache_friendly_layout).
+    """
+    name: str
+    template: str
+    output_format: str
+    schema: dict[str, Any]
+    parser: Callable[[str], dict[str, Any]]
+    prefix: str
+    data_template: str
+    system_prompt: str = SYSTEM_PROMPT
+
+
+TASK_SPECS = {
+    LLMTemplate.PRICE: TaskSpec(LLMTemplate.PRICE, PRICE_TEMPLATE, OUTPUT_FORMATS[LLMTemplate.PRICE], PRICE_SCHEMA, parse_price,
+                                PRICE_PREFIX, PRICE_DATA_TEMPLATE),
+    LLMTemplate.PRICE_NEWS: TaskSpec(LLMTemplate.PRICE_NEWS, PRICE_SENTIMENT_TEMPLATE, OUTPUT_FORMATS[LLMTemplate.PRICE_NEWS], PRICE_SCHEMA, parse_price,
+                                     PRICE_SENTIMENT_PREFIX, PRICE_SENTIMENT_DATA_TEMPLATE),
+    LLMTemplate.NEWS: TaskSpec(LLMTemplate.NEWS, NEWS_TEMPLATE, OUTPUT_FORMATS[LLMTemplate.NEWS], SENTIMENT_SCHEMA, parse_sentiment,
+                               NEWS_PREFIX, NEWS_DATA_TEMPLATE),
+    LLMTemplate.ESTIMATE_TICKER: TaskSpec(LLMTemplate.ESTIMATE_TICKER, TICKER_TEMPLATE, OUTPUT_FORMATS[LLMTemplate.ESTIMATE_TICKER], TICKER_SCHEMA, parse_ticker,
+                                          TICKER_PREFIX, TICKER_DATA_TEMPLATE),
+    LLMTemplate.ESTIMATE_EARNINGS: TaskSpec(LLMTemplate.ESTIMATE_EARNINGS, EARNINGS_TEMPLATE, OUTPUT_FORMATS[LLMTemplate.ESTIMATE_EARNINGS], EARNINGS_SCHEMA, parse_earnings,
+                                            EARNINGS_PREFIX, EARNINGS_DATA_TEMPLATE),
+}
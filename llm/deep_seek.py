@@ -1,105 +1,414 @@
+import time
+
+_IMPORT_START = time.perf_counter()
+
 import json
 import os
-import re
+import threading
+import numpy as np
 import pandas as pd
 
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import date
+from typing import Any, Callable
 
-from dotenv import load_dotenv
-from openai import OpenAI
-from typing import Any
-
-from extractor.price_extractor import PriceExtractor
-from extractor.news_extractor import NewsExtractor
-from extractor.earnings_call_extractor import EarningsCallExtractor
-from extractor.financial_statement_extractor import FinancialStatementExtractor
-
+# The extractors, openai and dotenv are imported on first use (see _lazy) so
+# that short jobs do not pay for clients and datasets they never touch.
 from . import *
+from .parsing import parse_json
+from .router import Endpoint, EndpointRouter
+from .sampling import assign_strata, initial_sample, next_batch, stratified_estimate, window_volatility
+from .stats import PipelineStats
 
-load_dotenv()
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
 
 class LLMForFinance:
-    def __init__(self, model: str = "deepseek-chat", temperature: float = 0.1, stream: bool = False, max_workers = 10) -> None:
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY",""), 
-                            base_url=os.getenv("DEEPSEEK_URL", ""))
+    def __init__(self, 
+                 model: str = "deepseek-chat", 
+                 temperature: float = 0.1, 
+                 stream: bool = False, 
+                 max_workers = 10,
+                 json_mode: bool = False,
+                 max_repairs: int = 1,
+                 endpoints: list[Endpoint] | None = None,
+                 ensemble_mode: str = "auto",
+                 ensemble_temperature: float = 0.7,
+                 cache_friendly_prompts: bool = False,
+                 compact_data: bool = False) -> None:
+        self.endpoints = endpoints
         self.model = model
         self.temperature = temperature        
         self.stream = stream
 
-        self.price_extractor = PriceExtractor()
-        self.news_extractor = NewsExtractor()
-        self.earnings_extractor = EarningsCallExtractor()
-        self.financial_statement_extractor = FinancialStatementExtractor()
-
         self.max_workers = max_workers
+
+        self._lazy_lock = threading.Lock()
+        self._lazy_locks: dict[str, threading.Lock] = {}
+        self._lazy_objects: dict[str, Any] = {}
+
+        # json_mode asks for a JSON object validated against the task schema
+        # instead of the ###!TAG!### line; either way, replies that fail to
+        # parse are re-asked up to max_repairs times with REPAIR_TEMPLATE.
+        self.json_mode = json_mode
+        self.max_repairs = max_repairs
+        self.stats = PipelineStats()
+
+        # Seconds spent importing this module and building each lazy component.
+        self._startup_seconds: dict[str, float] = {"import_s": _IMPORT_SECONDS}
+
+        # Ensembles ask for several samples in one request: "n" uses the `n`
+        # parameter, "packed" asks for several alternatives in one reply, and
+        # "auto" uses `n` until every endpoint has been seen ignoring it.
+        if ensemble_mode not in ("auto", "n", "packed"):
+            raise ValueError(f"Invalid ensemble mode: {ensemble_mode}")
+        self.ensemble_mode = ensemble_mode
+        self.ensemble_temperature = ensemble_temperature
+
+        # Put each task's static instructions in a shared system-message
+        # prefix and the per-request data last, so endpoint prefix caching
+        # (DeepSeek context cache, vLLM prefix caching) can hit.
+        self.cache_friendly_prompts = cache_friendly_prompts
+
+        # Load the datasets with categoricals, int32 day-number dates and
+        # compressed transcripts (see extractor.compact).
+        self.compact_data = compact_data
     
-    def load_template(self, template: LLMTemplate) -> None:
-        match template:
-            case LLMTemplate.PRICE:
-                self.template = PRICE_TEMPLATE
-            case LLMTemplate.PRICE_NEWS:
-                self.template = PRICE_SENTIMENT_TEMPLATE
-            case LLMTemplate.NEWS:
-                self.template = NEWS_TEMPLATE
-            case LLMTemplate.ESTIMATE_TICKER:
-                self.template = TICKER_TEMPLATE
-            case LLMTemplate.ESTIMATE_EARNINGS:
-                self.template = EARNINGS_TEMPLATE
-            case _:
-                raise Exception("Invalid Template Type")
+    def _lazy(self, name: str, factory: Callable[[], Any]) -> Any:
+        """
+        Build `name` with `factory` on first access (once, even when several
+        worker threads race for it) and record how long it took.
 
-    def analyze_sentiment(self, 
-                          ticker: str,
-                          date: str,
-                          headline: str,
-                          summary) -> dict[str, Any]:
-        def parse_sentiment_line(line: str) -> dict:
-            line = line.strip()
-            if not line.startswith("###!SENTIMENT!###"):
-                raise ValueError("Line does not start with '###!SENTIMENT!###'")
+        Each name has its own lock, so a factory can use other lazy
+        components (the shape index loads the price extractor) and unrelated
+        components build in parallel.
+        """
+        if name in self._lazy_objects:
+            return self._lazy_objects[name]
 
-            payload = line.replace("###!SENTIMENT!###", "").strip()
-            parts   = [p.strip() for p in payload.split("|")]
+        with self._lazy_lock:
+            lock = self._lazy_locks.setdefault(name, threading.Lock())
 
-            if len(parts) != 3:
-                raise ValueError("Expected exactly three fields separated by '|'")
+        with lock:
+            if name not in self._lazy_objects:
+                start = time.perf_counter()
+                self._lazy_objects[name] = factory()
+                self._startup_seconds[f"{name}_s"] = time.perf_counter() - start
 
-            score_str = parts[0]
-            if not re.fullmatch(r"-?\d+", score_str):
-                raise ValueError(f"Score is not an integer: {score_str}")
+        return self._lazy_objects[name]
 
-            score       = int(score_str)
-            confidence  = parts[1].title()
-            reason      = parts[2]
+    @property
+    def router(self) -> EndpointRouter:
+        def load():
+            from dotenv import load_dotenv
+            load_dotenv()
 
-            if confidence not in {"High", "Medium", "Low"}:
-                raise ValueError(f"Confidence must be High, Medium, or Low (got {confidence})")
+            # Without explicit endpoints, route everything to OPENAI_API_KEY/DEEPSEEK_URL.
+            return EndpointRouter(self.endpoints) if self.endpoints else EndpointRouter.from_env()
 
-            return {
-                "score": score,
-                "confidence": confidence,
-                "reason": reason,
+        return self._lazy("router", load)
+
+    @property
+    def price_extractor(self):
+        def load():
+            from extractor.price_extractor import PriceExtractor
+            return PriceExtractor(compact=self.compact_data)
+
+        return self._lazy("price_extractor", load)
+
+    @property
+    def news_extractor(self):
+        def load():
+            from extractor.news_extractor import NewsExtractor
+            return NewsExtractor(compact=self.compact_data)
+
+        return self._lazy("news_extractor", load)
+
+    @property
+    def earnings_extractor(self):
+        def load():
+            from extractor.earnings_call_extractor import EarningsCallExtractor
+            return EarningsCallExtractor(compact=self.compact_data)
+
+        return self._lazy("earnings_extractor", load)
+
+    @property
+    def financial_statement_extractor(self):
+        def load():
+            from extractor.financial_statement_extractor import FinancialStatementExtractor
+            return FinancialStatementExtractor(compact=self.compact_data)
+
+        return self._lazy("financial_statement_extractor", load)
+
+    def shape_index(self, window_size: int = 30, metric: str = "euclidean"):
+        """
+        Price-shape similarity index over the whole price universe, built
+        once per (window_size, metric).
+        """
+        def load():
+            from extractor.shape_index import PriceShapeIndex
+            return PriceShapeIndex(self.price_extractor, window_size, metric)
+
+        return self._lazy(f"shape_index_{window_size}_{metric}", load)
+
+    def startup_report(self) -> dict[str, float]:
+        """
+        Seconds spent importing this module and building each lazily created
+        component so far.
+        """
+        return dict(self._startup_seconds)
+
+    def memory_report(self) -> pd.DataFrame:
+        """
+        In-memory size of each dataset loaded so far, before and after the
+        compact conversion.
+        """
+        rows = [
+            self._lazy_objects[name].memory_report()
+            for name in ("price_extractor", "news_extractor", "financial_statement_extractor", "earnings_extractor")
+            if name in self._lazy_objects
+        ]
+
+        return pd.DataFrame(rows, columns=["dataset", "rows", "mb_before", "mb_after", "reduction"]).set_index("dataset")
+
+    def get_task_spec(self, template: LLMTemplate) -> TaskSpec:
+        if template not in TASK_SPECS:
+            raise Exception("Invalid Template Type")
+        return TASK_SPECS[template]
+
+    def _create(self, messages: list[dict[str, str]], pipeline: str, **kwargs) -> Any:
+        kwargs.setdefault("temperature", self.temperature)
+
+        response = self.router.create_chat_completion(
+            model=self.model,
+            messages=messages,
+            stream=self.stream,
+            **kwargs
+        )
+
+        self._record_usage(pipeline, getattr(response, "usage", None))
+
+        return response
+
+    def _chat(self, messages: list[dict[str, str]], pipeline: str, **kwargs) -> str:
+        return self._create(messages, pipeline, **kwargs).choices[0].message.content
+
+    def _record_usage(self, pipeline: str, usage: Any) -> None:
+        if usage is None:
+            return
+
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+
+        # DeepSeek reports prompt_cache_hit/miss_tokens; OpenAI and vLLM
+        # report prompt_tokens_details.cached_tokens.
+        hit = getattr(usage, "prompt_cache_hit_tokens", None)
+        miss = getattr(usage, "prompt_cache_miss_tokens", None)
+
+        if hit is None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            hit = (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+        if miss is None:
+            miss = prompt_tokens - hit
+
+        self.stats.increment(pipeline, "prompt_tokens", prompt_tokens)
+        self.stats.increment(pipeline, "completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+        self.stats.increment(pipeline, "cache_hit_tokens", hit)
+        self.stats.increment(pipeline, "cache_miss_tokens", miss)
+
+    def _messages(self, spec: TaskSpec, fields: dict[str, Any], extra: str = "") -> list[dict[str, str]]:
+        """
+        Chat messages for `spec` filled with `fields`; `extra` is appended to
+        the end of the user message.
+        """
+        if self.cache_friendly_prompts:
+            return [
+                {"role": "system", "content": spec.prefix},
+                {"role": "user", "content": spec.data_template.format(**fields) + extra}
+            ]
+
+        return [
+            {"role": "system", "content": spec.system_prompt},
+            {"role": "user", "content": spec.template.format(**fields) + extra}
+        ]
+
+    def _parse(self, spec: TaskSpec, text: str) -> dict[str, Any]:
+        if self.json_mode:
+            return parse_json(text, spec.schema)
+        return spec.parser(text)
+
+    def _complete(self, spec: TaskSpec, fields: dict[str, Any], extra: str = "") -> dict[str, Any]:
+        """
+        Send one prompt built from `fields` and parse the reply for `spec`. A
+        reply that fails to parse is re-asked with a short repair prompt
+        carrying only the bad answer and the expected format, not the
+        original data. Raises ValueError once `max_repairs` attempts are
+        exhausted.
+        """
+        kwargs = {}
+        output_format = spec.output_format
+
+        if self.json_mode:
+            extra = extra + JSON_OUTPUT_INSTRUCTION.format(schema=json.dumps(spec.schema))
+            # JSON mode rejects prompts that do not mention JSON, so the
+            # repair prompt's format line has to say it.
+            output_format = JSON_REPAIR_FORMAT.format(schema=json.dumps(spec.schema))
+            kwargs["response_format"] = {"type": "json_object"}
+
+        self.stats.increment(spec.name, "calls")
+        result = self._chat(self._messages(spec, fields, extra), spec.name, **kwargs)
+
+        try:
+            return self._parse(spec, result)
+        except ValueError as exc:
+            error = exc
+            self.stats.increment(spec.name, "parse_failures")
+
+        for _ in range(self.max_repairs):
+            self.stats.increment(spec.name, "repairs")
+            result = self._chat([
+                {"role": "system", "content": spec.system_prompt},
+                {"role": "user", "content": REPAIR_TEMPLATE.format(error=error, answer=result, output_format=output_format)}
+            ], spec.name, **kwargs)
+
+            try:
+                parsed = self._parse(spec, result)
+            except ValueError as exc:
+                error = exc
+                continue
+
+            self.stats.increment(spec.name, "repaired")
+            return parsed
+
+        self.stats.increment(spec.name, "unusable")
+        raise ValueError(f"Unparseable {spec.name} response after {self.max_repairs} repair(s): {error}")
+
+    def _parse_packed(self, spec: TaskSpec, text: str) -> list[dict[str, Any]]:
+        if self.json_mode:
+            schema = {
+                "type": "object",
+                "properties": {"samples": {"type": "array", "items": spec.schema}},
+                "required": ["samples"],
             }
+            return parse_json(text, schema)["samples"]
+
+        samples = []
+        for line in text.splitlines():
+            try:
+                samples.append(spec.parser(line))
+            except ValueError:
+                continue
+
+        return samples
+
+    def _complete_samples(self, spec: TaskSpec, fields: dict[str, Any], n: int) -> list[dict[str, Any]]:
+        """
+        Draw `n` independent answers to one prompt in a single request and
+        return the ones that parse. Unparseable samples are dropped rather
+        than repaired; raises ValueError if none parse.
+        """
+        kwargs = {"temperature": self.ensemble_temperature}
+        output_format = spec.output_format
+
+        if self.json_mode:
+            output_format = json.dumps(spec.schema)
+            kwargs["response_format"] = {"type": "json_object"}
+
+        samples = []
+        texts = []
+
+        self.stats.increment(spec.name, "calls")
+
+        # In auto mode `n` is used until every endpoint has been seen ignoring
+        # it; the router tracks this per endpoint and sends n > 1 requests only
+        # to endpoints that may honour it. Samples an endpoint did not return
+        # are drawn with one packed request.
+        use_n = self.ensemble_mode == "n" or (self.ensemble_mode == "auto" and self.router.supports_n())
+
+        if use_n:
+            extra = JSON_OUTPUT_INSTRUCTION.format(schema=output_format) if self.json_mode else ""
+            response = self._create(self._messages(spec, fields, extra), spec.name, n=n, **kwargs)
+            texts = [choice.message.content for choice in response.choices]
+
+            for text in texts:
+                try:
+                    samples.append(self._parse(spec, text))
+                except ValueError:
+                    self.stats.increment(spec.name, "parse_failures")
+
+        remaining = n - len(texts)
+        if remaining > 0:
+            self.stats.increment(spec.name, "packed_requests")
+            if self.json_mode:
+                extra = PACKED_JSON_INSTRUCTION.format(n=remaining, schema=output_format)
+            else:
+                extra = PACKED_SAMPLES_INSTRUCTION.format(n=remaining, output_format=output_format)
+
+            text = self._chat(self._messages(spec, fields, extra), spec.name, **kwargs)
+
+            try:
+                samples.extend(self._parse_packed(spec, text)[:remaining])
+            except ValueError:
+                self.stats.increment(spec.name, "parse_failures")
 
-        prompt = self.template.format(news_data=str({
+        self.stats.increment(spec.name, "samples", len(samples))
+
+        if not samples:
+            self.stats.increment(spec.name, "unusable")
+            raise ValueError(f"No parseable {spec.name} samples out of {n}")
+
+        return samples
+
+    def endpoint_report(self) -> pd.DataFrame:
+        return self.router.report()
+
+    def cache_report(self) -> pd.DataFrame:
+        """
+        Per-pipeline prompt tokens served from the endpoint's prefix cache.
+        """
+        df = self.stats.report()
+
+        for column in ["prompt_tokens", "completion_tokens", "cache_hit_tokens", "cache_miss_tokens"]:
+            if column not in df:
+                df[column] = 0
+
+        df = df[df["prompt_tokens"] > 0][["prompt_tokens", "completion_tokens", "cache_hit_tokens", "cache_miss_tokens"]].copy()
+        df["cache_hit_rate"] = df["cache_hit_tokens"] / (df["cache_hit_tokens"] + df["cache_miss_tokens"]).where(lambda x: x > 0)
+
+        return df
+
+    def parse_report(self) -> pd.DataFrame:
+        """
+        Per-pipeline call counts with parse-failure, repair-success and
+        unusable-output rates.
+        """
+        df = self.stats.report()
+
+        for column in ["calls", "parse_failures", "repairs", "repaired", "unusable"]:
+            if column not in df:
+                df[column] = 0
+
+        df = df[df["calls"] > 0][["calls", "parse_failures", "repairs", "repaired", "unusable"]].copy()
+
+        df["parse_failure_rate"] = df["parse_failures"] / df["calls"].where(df["calls"] > 0)
+        df["repair_success_rate"] = df["repaired"] / df["repairs"].where(df["repairs"] > 0)
+        df["unusable_rate"] = df["unusable"] / df["calls"].where(df["calls"] > 0)
+
+        return df
+
+    def analyze_sentiment(self, 
+                          ticker: str,
+                          date: str,
+                          headline: str,
+                          summary,
+                          spec: TaskSpec | None = None) -> dict[str, Any]:
+        spec = spec or self.get_task_spec(LLMTemplate.NEWS)
+
+        fields = {"news_data": str({
             "ticker": ticker,
             "headline": headline,
             "summary": summary
-        }))
-            
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": "You are a professional financial analyst."},
-                {"role": "user", "content": prompt}
-            ],
-            stream=self.stream,
-            temperature=self.temperature
-        )
-        result = response.choices[0].message.content
-        
-        sentiment = parse_sentiment_line(result)
+        })}
+
+        sentiment = self._complete(spec, fields)
 
         sentiment.update({
                 'ticker': ticker,
@@ -112,71 +421,492 @@ class LLMForFinance:
 
         return sentiment
         
-    def analyze_ticker_sentiments(self,
-                                  ticker: str,
-                                  start_date: str,
-                                  end_date: str) -> pd.DataFrame:
-        self.load_template(LLMTemplate.NEWS)
+    def _score_news(self,
+                    items: list[dict[str, Any]],
+                    representatives: list[int]) -> pd.DataFrame:
+        """
+        Score only the cluster representatives of `items` and fan each score
+        back out to every member of its cluster (clusters never span tickers,
+        see NewsExtractor.deduplicate_news).
+        """
+        spec = self.get_task_spec(LLMTemplate.NEWS)
 
-        results = []
+        unique = sorted(set(representatives))
+        avoided = len(items) - len(unique)
 
-        extracted_data = self.news_extractor.extract_news_json(ticker, start_date, end_date, include_ticker=True)
+        self.stats.increment(spec.name, "news_items", len(items))
+        self.stats.increment(spec.name, "dedup_calls_avoided", avoided)
+        print(f"[dedup] {len(items)} articles, {len(unique)} scored, {avoided} calls avoided")
+
+        scored = {}
 
         with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
-            future_to_item = {
+            future_to_index = {
                 pool.submit(
                     self.analyze_sentiment,
-                    item["ticker"],
-                    item["date"],
-                    item["headline"],
-                    item["summary"]
-                ): item
-                for item in extracted_data
+                    items[i]["ticker"],
+                    items[i]["date"],
+                    items[i]["headline"],
+                    items[i]["summary"],
+                    spec
+                ): i
+                for i in unique
             }
 
-            for fut in as_completed(future_to_item):
-                item = future_to_item[fut]
+            for fut in as_completed(future_to_index):
+                item = items[future_to_index[fut]]
                 try:
-                    sentiment_dict = fut.result()      # returns dict from analyze_sentiment
-                    results.append(sentiment_dict)
+                    scored[future_to_index[fut]] = fut.result()      # returns dict from analyze_sentiment
                 except Exception as exc:
                     print(f"[{item['ticker']} | {item['date']}] sentiment failed: {exc}")
 
+        results = []
+
+        for item, representative in zip(items, representatives):
+            if representative not in scored:
+                continue
+
+            sentiment = dict(scored[representative])
+            sentiment.update({
+                'ticker': item["ticker"],
+                "headline": item["headline"],
+                "summary": item["summary"],
+                "date": item["date"]
+            })
+            results.append(sentiment)
+
         return pd.DataFrame(results)
+
+    def analyze_ticker_sentiments(self,
+                                  ticker: str,
+                                  start_date: str,
+                                  end_date: str,
+                                  dedupe: bool = True) -> pd.DataFrame:
+        extracted_data = self.news_extractor.extract_news_json(ticker, start_date, end_date, include_ticker=True)
+
+        if dedupe:
+            representatives = self.news_extractor.deduplicate_news(extracted_data)
+        else:
+            representatives = list(range(len(extracted_data)))
+
+        return self._score_news(extracted_data, representatives)
     
     def analyze_tickers_sentiments(self,
                                    tickers: list[str],
                                    start_date: str,
-                                   end_date) -> pd.DataFrame:
+                                   end_date,
+                                   dedupe: bool = True) -> pd.DataFrame:
         results = []
 
         for ticker in tickers:
-            df = self.analyze_ticker_sentiments(ticker, start_date, end_date)
+            df = self.analyze_ticker_sentiments(ticker, start_date, end_date, dedupe)
             results.append(df)
 
         return pd.concat(results)
 
+    def _price_series(self, ticker: str, start_date: str, end_date: str) -> list[dict[str, Any]]:
+        extracted_data = self.price_extractor.extract_ticker_price_json(ticker, start_date, end_date)
+        extracted_data = json.loads(extracted_data)
+
+        return [{'close': data['close'], 'date': data['date']} for data in extracted_data]
+
+    @staticmethod
+    def _with_estimated_dates(df: pd.DataFrame) -> pd.DataFrame:
+        df = df.copy()
+        
+        df['last_date'] = pd.to_datetime(df['last_date'])
+        df['estimated_date'] = df['last_date'].shift(-1)
+        
+        df.loc[df['estimated_date'].isna(), 'estimated_date'] = df['last_date'].iloc[-1] + pd.offsets.BDay(1)
+
+        return df
+
+    def _forecast_window(self,
+                         spec: TaskSpec,
+                         ticker: str,
+                         window: list[dict[str, Any]],
+                         sentiment_df: pd.DataFrame,
+                         n_samples: int = 1) -> dict[str, Any]:
+        last_data = window[-1]
+        start_data = window[0]
+
+        date_start = start_data['date']
+        date_end = last_data['date']
+
+        sentiment_data = sentiment_df[(sentiment_df['date'] >= date_start) & (sentiment_df['date'] <= date_end)]
+        sentiment_data = sentiment_data[['date', 'score', 'confidence']].to_dict(orient="records")
+
+        fields = {"price_data": str(window), "sentiment_data": str(sentiment_data)}
+
+        last_close = last_data['close']
+        last_date = last_data['date']
+
+        if n_samples > 1:
+            try:
+                prices = np.array([sample["price"] for sample in self._complete_samples(spec, fields, n_samples)])
+            except ValueError as exc:
+                print(f"[{ticker} | {date_end}] price ensemble failed: {exc}")
+                prices = np.array([])
+
+            print(ticker, np.median(prices) if len(prices) else None, last_date, last_close)
+
+            return {
+                'estimated_price': float(np.median(prices)) if len(prices) else None,
+                'price_mean': float(prices.mean()) if len(prices) else None,
+                'price_std': float(prices.std()) if len(prices) else None,
+                'price_min': float(prices.min()) if len(prices) else None,
+                'price_max': float(prices.max()) if len(prices) else None,
+                'up_share': float((prices > last_close).mean()) if len(prices) else None,
+                'down_share': float((prices < last_close).mean()) if len(prices) else None,
+                'n_samples': len(prices),
+                'last_date': last_date,
+                'last_close': last_close,
+            }
+
+        try:
+            price = self._complete(spec, fields)["price"]
+        except ValueError as exc:
+            print(f"[{ticker} | {date_end}] price parse failed: {exc}")
+            price = None
+
+        print(ticker, price, last_date, last_close)
+
+        return {
+            'estimated_price': price,
+            'last_date': last_date,
+            'last_close': last_close,
+        }
+
+    def _estimate_ticker_window(self,
+                                spec: TaskSpec,
+                                ticker: str,
+                                window: list[dict[str, Any]],
+                                shortlist_k: int | None = None) -> dict[str, Any]:
+        fields = {"price_data": str(window)}
+        extra = ""
+
+        if shortlist_k:
+            candidates = self.shape_index(len(window)).shortlist(window, shortlist_k)
+            extra = TICKER_CANDIDATES_HINT.format(candidates=", ".join(candidates))
+
+        last_close = window[-1]['close']
+        last_date = window[-1]['date']
+
+        try:
+            ticker_estimate = self._complete(spec, fields, extra)["ticker"]
+        except ValueError as exc:
+            print(f"[{ticker} | {last_date}] ticker parse failed: {exc}")
+            ticker_estimate = None
+
+        print(ticker, ticker_estimate, last_date, last_close)
+
+        return {
+            'estimated_ticker': ticker_estimate,
+            'last_date': last_date,
+            'last_close': last_close,
+        }
+
+    def _candidate_windows(self,
+                           tickers: list[str],
+                           start_date: str,
+                           end_date: str,
+                           window_size: int) -> tuple[pd.DataFrame, dict[str, list[dict[str, Any]]]]:
+        """
+        Every window forecast_price_data / estimate_stock_ticker would run for
+        `tickers`, as (ticker, index, last_date, volatility) rows, together
+        with each ticker's price series.
+        """
+        series = {ticker: self._price_series(ticker, start_date, end_date) for ticker in tickers}
+        frames = []
+
+        for ticker, price_data in series.items():
+            closes = np.array([data['close'] for data in price_data], dtype=float)
+            indices = np.arange(window_size, len(price_data))
+
+            frames.append(pd.DataFrame({
+                'ticker': ticker,
+                'index': indices,
+                'last_date': [price_data[i - 1]['date'] for i in indices],
+                'volatility': window_volatility(closes, window_size),
+            }))
+
+        frames = [df for df in frames if not df.empty]
+        windows = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['ticker', 'index', 'last_date', 'volatility'])
+
+        return windows, series
+
+    def _run_sampled(self,
+                     windows: pd.DataFrame,
+                     evaluate: Callable[[Any], dict[str, Any]],
+                     metric: str,
+                     method: str,
+                     stride: int,
+                     fraction: float,
+                     max_windows: int | None,
+                     target_half_width: float,
+                     batch_size: int,
+                     n_strata: int,
+                     seed: int) -> tuple[pd.DataFrame, np.ndarray, list[int]]:
+        """
+        Evaluate an initial sample of `windows`, then add `batch_size` windows
+        at a time (see sampling.next_batch) until the confidence interval of
+        the 0/1 `metric` is no wider than +/- `target_half_width` (and not
+        zero, which only a full census gives), `max_windows` have been
+        evaluated, or every window has.
+
+        A window whose evaluation raises (an API or routing failure) is
+        recorded as failed and left out of the estimate; its stratum is then
+        topped up with another window. Sampling stops early if a whole round
+        fails.
+        """
+        rng = np.random.default_rng(seed)
+        strata = assign_strata(windows['volatility'].to_numpy(), n_strata)
+        taken = np.zeros(len(windows), dtype=bool)
+        values = np.full(len(windows), np.nan)
+        results = {}
+        failed = 0
+
+        def attempt(row) -> dict[str, Any] | None:
+            try:
+                return evaluate(row)
+            except Exception as exc:
+                print(f"[{row['ticker']} | {row['last_date']}] sampled window failed: {exc}")
+                return None
+
+        pending = initial_sample(strata, method, stride, fraction, rng)
+        if max_windows and len(pending) > max_windows:
+            pending = np.sort(rng.choice(pending, size=max_windows, replace=False))
+
+        while len(pending):
+            rows = [windows.iloc[pos] for pos in pending]
+            round_failed = 0
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                for pos, result in zip(pending, pool.map(attempt, rows)):
+                    if result is None:
+                        round_failed += 1
+                        continue
+
+                    results[pos] = result
+                    values[pos] = result[metric]
+
+            failed += round_failed
+            self.stats.increment("sampled_backtest", "failed_windows", round_failed)
+
+            taken[pending] = True
+            estimate = stratified_estimate(values, strata, binary=True)
+            print(f"[sampled] {taken.sum()}/{len(windows)} windows ({failed} failed), {metric} = {estimate['estimate']} +/- {estimate['half_width']:.4f}")
+
+            if 0 < estimate['half_width'] <= target_half_width:
+                break
+
+            if round_failed == len(pending):
+                print("[sampled] every window in the last round failed, stopping")
+                break
+
+            budget = batch_size if not max_windows else min(batch_size, max_windows - int(taken.sum()))
+            pending = next_batch(values, strata, taken, budget, rng, binary=True) if budget > 0 else []
+
+        positions = sorted(results)
+        if not positions:
+            return pd.DataFrame(), strata, positions
+
+        df = pd.DataFrame([results[pos] for pos in positions])
+        df['ticker'] = windows['ticker'].to_numpy()[positions]
+        df['stratum'] = strata[positions]
+
+        return df, strata, positions
+
+    @staticmethod
+    def _sampled_summary(df: pd.DataFrame,
+                         strata: np.ndarray,
+                         positions: list[int],
+                         metrics: dict[str, tuple[float, float] | None],
+                         binary: tuple[str, ...] = ()) -> pd.DataFrame:
+        rows = {}
+        for metric, bounds in metrics.items():
+            values = np.full(len(strata), np.nan)
+            values[positions] = df[metric].to_numpy(dtype=float)
+            rows[metric] = stratified_estimate(values, strata, bounds=bounds, binary=metric in binary)
+
+        return pd.DataFrame.from_dict(rows, orient='index')
+
+    def sample_forecast_backtest(self,
+                                 tickers: list[str],
+                                 start_date: str,
+                                 end_date: str,
+                                 window_size = 30,
+                                 with_news=False,
+                                 n_samples: int = 1,
+                                 method: str = "stride",
+                                 stride: int = 5,
+                                 fraction: float = 0.1,
+                                 max_windows: int | None = None,
+                                 target_half_width: float = 0.05,
+                                 batch_size: int = 20,
+                                 n_strata: int = 3,
+                                 seed: int = 42) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        forecast_tickers_price_data on a sample of the windows: every
+        `stride`-th window or a stratified random `fraction`, then more
+        windows where directional accuracy is least certain (see _run_sampled).
+
+        Returns the forecasts of the sampled windows (with the actual next
+        close, `direction_hit` and absolute percentage error `ape`) and a
+        summary of directional accuracy and MAPE over all windows, with 95%
+        confidence intervals.
+        """
+        spec = self.get_task_spec(LLMTemplate.PRICE_NEWS if with_news else LLMTemplate.PRICE)
+
+        sentiment_df = pd.read_csv('SENTIMENT_SCORING.csv')
+        sentiment_by_ticker = {ticker: sentiment_df[sentiment_df['ticker'] == ticker] for ticker in tickers}
+
+        windows, series = self._candidate_windows(tickers, start_date, end_date, window_size)
+
+        if windows.empty:
+            return pd.DataFrame(), pd.DataFrame()
+
+        def evaluate(row) -> dict[str, Any]:
+            price_data = series[row['ticker']]
+            i = int(row['index'])
+
+            prediction = self._forecast_window(
+                spec, row['ticker'], price_data[i - window_size:i], sentiment_by_ticker[row['ticker']], n_samples
+            )
+
+            estimate = prediction['estimated_price']
+            last_close = prediction['last_close']
+            actual = price_data[i]['close']
+
+            prediction['estimated_date'] = price_data[i]['date']
+            prediction['actual_close'] = actual
+            # A failed parse counts as a miss, as a forecast nobody can trade on.
+            prediction['direction_hit'] = float(estimate is not None and np.sign(estimate - last_close) == np.sign(actual - last_close))
+            prediction['ape'] = abs(estimate - actual) / actual if estimate is not None else np.nan
+
+            return prediction
+
+        df, strata, positions = self._run_sampled(
+            windows, evaluate, 'direction_hit', method, stride, fraction,
+            max_windows, target_half_width, batch_size, n_strata, seed,
+        )
+
+        if df.empty:
+            return df, pd.DataFrame()
+
+        summary = self._sampled_summary(df, strata, positions, {'direction_hit': None, 'ape': (0.0, np.inf)},
+                                       binary=('direction_hit',))
+
+        df['last_date'] = pd.to_datetime(df['last_date'])
+        df['estimated_date'] = pd.to_datetime(df['estimated_date'])
+
+        return df, summary
+
+    def sample_ticker_backtest(self,
+                               tickers: list[str],
+                               start_date: str,
+                               end_date: str,
+                               window_size: int = 30,
+                               shortlist_k: int | None = None,
+                               method: str = "stride",
+                               stride: int = 5,
+                               fraction: float = 0.1,
+                               max_windows: int | None = None,
+                               target_half_width: float = 0.05,
+                               batch_size: int = 20,
+                               n_strata: int = 3,
+                               seed: int = 42) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        estimate_tickers on a sample of the windows, sampled like
+        sample_forecast_backtest. Returns the sampled estimates (with `hit`)
+        and the estimated identification accuracy over all windows with its
+        95% confidence interval.
+        """
+        spec = self.get_task_spec(LLMTemplate.ESTIMATE_TICKER)
+
+        windows, series = self._candidate_windows(tickers, start_date, end_date, window_size)
+
+        if windows.empty:
+            return pd.DataFrame(), pd.DataFrame()
+
+        def evaluate(row) -> dict[str, Any]:
+            price_data = series[row['ticker']]
+            i = int(row['index'])
+
+            prediction = self._estimate_ticker_window(spec, row['ticker'], price_data[i - window_size:i], shortlist_k)
+            prediction['estimated_date'] = price_data[i]['date']
+            prediction['hit'] = float(prediction['estimated_ticker'] == row['ticker'])
+
+            return prediction
+
+        df, strata, positions = self._run_sampled(
+            windows, evaluate, 'hit', method, stride, fraction,
+            max_windows, target_half_width, batch_size, n_strata, seed,
+        )
+
+        if df.empty:
+            return df, pd.DataFrame()
+
+        summary = self._sampled_summary(df, strata, positions, {'hit': None}, binary=('hit',))
+
+        df['last_date'] = pd.to_datetime(df['last_date'])
+        df['estimated_date'] = pd.to_datetime(df['estimated_date'])
+
+        return df, summary
+
+    def update_sentiments(self,
+                          tickers: list[str],
+                          start_date: str,
+                          end_date: str,
+                          output_path: str,
+                          dedupe: bool = True) -> pd.DataFrame:
+        """
+        Incremental analyze_tickers_sentiments: scores only articles not
+        already in `output_path` (matched on ticker, date and headline),
+        appends them and writes the file back.
+        """
+        previous = pd.read_csv(output_path) if os.path.exists(output_path) else pd.DataFrame()
+
+        df = self.news_extractor.extract_news_for_tickers(tickers, start_date, end_date)
+        items = df[["ticker", "date", "headline", "summary"]].to_dict(orient="records")
+
+        if not previous.empty:
+            seen = set(zip(previous["ticker"], previous["date"].astype(str), previous["headline"]))
+            items = [item for item in items if (item["ticker"], str(item["date"]), item["headline"]) not in seen]
+
+        print(f"[update] {len(items)} new articles for {len(tickers)} tickers")
+
+        if not items:
+            return previous
+
+        if dedupe:
+            representatives = self.news_extractor.deduplicate_news(items)
+        else:
+            representatives = list(range(len(items)))
+
+        combined = pd.concat([previous, self._score_news(items, representatives)], ignore_index=True)
+        combined.to_csv(output_path, index=False)
+
+        return combined
+
     def forecast_price_data(self, 
                             ticker: str,
                             start_date: str,
                             end_date: str, 
                             window_size = 30, 
-                            with_news=False) -> pd.DataFrame:
-        
-        if not with_news:
-            self.load_template(LLMTemplate.PRICE)
-        else:
-            self.load_template(LLMTemplate.PRICE_NEWS)
-
-        def extract_price(text: str) ->  float | None:
-            pattern = r'###!PRICE!###\s*(\d+\.?\d*)'
-            match = re.search(pattern, text)
-            if match:
-                return float(match.group(1))
-            return None
+                            with_news=False,
+                            n_samples: int = 1,
+                            after_date: str | None = None) -> pd.DataFrame:
+        """
+        With `n_samples` > 1 each window is an ensemble of that many forecasts
+        drawn in a single request; `estimated_price` is then their median, with
+        the spread and the share of samples above / below the last close.
 
-        extracted_data = self.price_extractor.extract_ticker_price_json(ticker, start_date, end_date)
-        extracted_data = json.loads(extracted_data)
+        With `after_date`, only windows ending after that date are forecast;
+        windows are still laid out from `start_date`, so they line up with an
+        earlier run over the same start date.
+        """
+        spec = self.get_task_spec(LLMTemplate.PRICE_NEWS if with_news else LLMTemplate.PRICE)
 
         # extracted_news_data = self.news_extractor.extract_news_json(ticker, start_date, end_date, include_ticker=True)
 
@@ -184,62 +914,35 @@ class LLMForFinance:
         sentiment_df = pd.read_csv('SENTIMENT_SCORING.csv')
         sentiment_df = sentiment_df[sentiment_df['ticker'] == ticker]
 
-        price_data = [{'close': data['close'], 'date': data['date']} for data in extracted_data]
+        price_data = self._price_series(ticker, start_date, end_date)
 
         predictions = []
         
         for i in range(window_size, len(price_data)):
             window = price_data[i - window_size:i]
-            last_data = window[-1]
-            start_data = window[0]
-
-            date_start = start_data['date']
-            date_end = last_data['date']
-
-            sentiment_data = sentiment_df[(sentiment_df['date'] >= date_start) & (sentiment_df['date'] <= date_end)]
-            sentiment_data = sentiment_data[['date', 'score', 'confidence']].to_dict(orient="records")
-
-            prompt = self.template.format(price_data=str(window), sentiment_data=str(sentiment_data))
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a professional financial analyst."},
-                    {"role": "user", "content": prompt}
-                ],
-                stream=self.stream,
-                temperature=self.temperature
-            )
-            result = response.choices[0].message.content
-            price = extract_price(result)
-
-            last_close = last_data['close']
-            last_date = last_data['date']
 
-            print(ticker, price, last_date, last_close)
+            if after_date and window[-1]['date'] <= after_date:
+                continue
 
-            predictions.append({
-                'estimated_price': price,
-                'last_date': last_date,
-                'last_close': last_close,
-            })
+            predictions.append(self._forecast_window(spec, ticker, window, sentiment_df, n_samples))
 
         df = pd.DataFrame(predictions)
-        df = df.copy()
-        
-        df['last_date'] = pd.to_datetime(df['last_date'])
-        df['estimated_date'] = df['last_date'].shift(-1)
-        
-        df.loc[df['estimated_date'].isna(), 'estimated_date'] = df['last_date'].iloc[-1] + pd.offsets.BDay(1)
 
-        return df
+        if df.empty:
+            return df
+
+        return self._with_estimated_dates(df)
 
 
     def forecast_tickers_price_data(self, 
                         tickers: list[str],
                         start_date: str,
                         end_date: str, 
-                        window_size = 30) -> pd.DataFrame:
+                        window_size = 30,
+                        with_news=False,
+                        n_samples: int = 1,
+                        after_dates: dict[str, str] | None = None) -> pd.DataFrame:
+        after_dates = after_dates or {}
         frames = []
         with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
             future_to_ticker = {
@@ -248,7 +951,10 @@ class LLMForFinance:
                     t,
                     start_date,
                     end_date,
-                    window_size
+                    window_size,
+                    with_news,
+                    n_samples,
+                    after_dates.get(t)
                 ): t
                 for t in tickers
             }
@@ -262,7 +968,53 @@ class LLMForFinance:
                 except Exception as e:
                     print(f"[{ticker}] forecast failed: {e}")
 
+        if not frames:
+            return pd.DataFrame()
+
         return pd.concat(frames, ignore_index=True)
+
+    def update_price_forecasts(self,
+                               tickers: list[str],
+                               start_date: str,
+                               end_date: str,
+                               output_path: str,
+                               window_size = 30,
+                               with_news=False,
+                               n_samples: int = 1) -> pd.DataFrame:
+        """
+        Incremental forecast_tickers_price_data: forecasts only the windows
+        ending after the last one already in `output_path` for each ticker,
+        appends them and writes the file back. Use the same `start_date` and
+        `window_size` as the run that produced the file.
+        """
+        previous = pd.read_csv(output_path) if os.path.exists(output_path) else pd.DataFrame()
+        after_dates = {}
+
+        if not previous.empty:
+            previous['last_date'] = pd.to_datetime(previous['last_date'])
+            previous['estimated_date'] = pd.to_datetime(previous['estimated_date'])
+
+            last_dates = previous.groupby('ticker')['last_date'].max()
+            after_dates = {ticker: d.strftime("%Y-%m-%d") for ticker, d in last_dates.items()}
+
+        new = self.forecast_tickers_price_data(tickers, start_date, end_date, window_size, with_news, n_samples, after_dates)
+        print(f"[update] {len(new)} new forecast windows for {len(tickers)} tickers")
+
+        if new.empty:
+            return previous
+
+        combined = pd.concat([previous, new], ignore_index=True)
+        combined = combined.sort_values(['ticker', 'last_date'], ignore_index=True)
+
+        # The last previous window's estimated_date was a business-day guess;
+        # recompute it now that the following window is known.
+        combined['estimated_date'] = combined.groupby('ticker')['last_date'].shift(-1)
+        missing = combined['estimated_date'].isna()
+        combined.loc[missing, 'estimated_date'] = combined.loc[missing, 'last_date'] + pd.offsets.BDay(1)
+
+        combined.to_csv(output_path, index=False)
+
+        return combined
     
     def estimate_stock_ticker(
                 self,
@@ -270,70 +1022,46 @@ class LLMForFinance:
                 start_date: str,
                 end_date: str,
                 window_size: int = 30,
+                shortlist_k: int | None = None,
+                after_date: str | None = None,
             ):
-        
-        self.load_template(LLMTemplate.ESTIMATE_TICKER)
-        
-        def extract_ticker(text: str) -> str | None:
-            pattern = r'###!TICKER!###\s*([A-Z]{1,5})'
-            match = re.search(pattern, text)
-            if match:
-                return match.group(1)
-            return None
-        
-        extracted_data = self.price_extractor.extract_ticker_price_json(ticker, start_date, end_date)
-        extracted_data = json.loads(extracted_data)
+        """
+        With `shortlist_k`, each prompt also lists the `shortlist_k` most
+        similar tickers from the price-shape index (excluding windows that
+        overlap the queried dates).
 
-        price_data = [{'close': data['close'], 'date': data['date']} for data in extracted_data]
+        With `after_date`, only windows ending after that date are run, as in
+        forecast_price_data.
+        """
+        spec = self.get_task_spec(LLMTemplate.ESTIMATE_TICKER)
+        
+        price_data = self._price_series(ticker, start_date, end_date)
 
         predictions = []
         
         for i in range(window_size, len(price_data)):
             window = price_data[i - window_size:i]
-            last_data = window[-1]
-            start_data = window[0]
-            print(last_data)
-
-            prompt = self.template.format(price_data=str(window))
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": "You are a professional financial analyst."},
-                    {"role": "user", "content": prompt}
-                ],
-                stream=self.stream,
-                temperature=self.temperature
-            )
-            result = response.choices[0].message.content
-            ticker_estimate = extract_ticker(result)
 
-            last_close = last_data['close']
-            last_date = last_data['date']
+            if after_date and window[-1]['date'] <= after_date:
+                continue
 
-            print(ticker, ticker_estimate, last_date, last_close)
+            print(window[-1])
 
-            predictions.append({
-                'estimated_ticker': ticker_estimate,
-                'last_date': last_date,
-                'last_close': last_close,
-            })
+            predictions.append(self._estimate_ticker_window(spec, ticker, window, shortlist_k))
             
         df = pd.DataFrame(predictions)
-        df = df.copy()
-        
-        df['last_date'] = pd.to_datetime(df['last_date'])
-        df['estimated_date'] = df['last_date'].shift(-1)
-        
-        df.loc[df['estimated_date'].isna(), 'estimated_date'] = df['last_date'].iloc[-1] + pd.offsets.BDay(1)
 
-        return df
+        if df.empty:
+            return df
+
+        return self._with_estimated_dates(df)
     
     def estimate_tickers(self, 
                     tickers: list[str],
                     start_date: str,
                     end_date: str, 
-                    window_size = 30) -> pd.DataFrame:
+                    window_size = 30,
+                    shortlist_k: int | None = None) -> pd.DataFrame:
         frames = []
         with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
             future_to_ticker = {
@@ -342,7 +1070,8 @@ class LLMForFinance:
                     t,
                     start_date,
                     end_date,
-                    window_size
+                    window_size,
+                    shortlist_k
                 ): t
                 for t in tickers
             }
@@ -362,9 +1091,16 @@ class LLMForFinance:
             self,
             ticker: str,
             year: int,
-            quarter: str
+            quarter: str,
+            news_top_k: int | None = 20,
+            news_token_budget: int | None = 3000
     ) -> pd.DataFrame:
-        self.load_template(LLMTemplate.ESTIMATE_EARNINGS)
+        """
+        Only the `news_top_k` quarter articles most relevant to EARNINGS_NEWS_QUERY
+        that fit in `news_token_budget` tokens go into the prompt; pass None for
+        both to include every article.
+        """
+        spec = self.get_task_spec(LLMTemplate.ESTIMATE_EARNINGS)
         
         def get_quarter_date_range(year: int, quarter: str) -> tuple[str, str]:
             """Returns the (start_date, end_date) of a given quarter in 'YYYY-MM-DD' format."""
@@ -386,37 +1122,20 @@ class LLMForFinance:
             return start.isoformat(), end.isoformat()
 
 
-        def parse_estimated_earnings(result: str) -> tuple[int, float]:
-            pattern = r"###EARNINGS###\s*(\d+)\s*\|\s*([0-9.]+)"
-            match = re.search(pattern, result)
-            
-            if match:
-                revenue = int(match.group(1))
-                eps = float(match.group(2))
-                return revenue, eps
-            else:
-                raise ValueError("Earnings result not found or improperly formatted.")
-        
         start_date, end_date = get_quarter_date_range(year, quarter)
 
         prev_earnings_call = self.earnings_extractor.get_previous_quarters_transcripts_json(ticker, year, quarter, 1)
         prev_earnings = self.financial_statement_extractor.get_previous_quarters_statements_json(ticker, year, quarter, 2)
-        news_data = self.news_extractor.extract_news_json(ticker, start_date, end_date, include_ticker=True)
+        if news_top_k is None and news_token_budget is None:
+            news_data = self.news_extractor.extract_news_json(ticker, start_date, end_date, include_ticker=True)
+        else:
+            news_data = self.news_extractor.retrieve_news_json(ticker, EARNINGS_NEWS_QUERY, start_date, end_date,
+                                                               news_top_k, news_token_budget, include_ticker=True)
 
-        prompt = self.template.format(prev_earnings_call=str(prev_earnings_call), prev_financials=str(prev_earnings), news_data=str(news_data))
-        
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": "You are a professional financial analyst."},
-                {"role": "user", "content": prompt}
-            ],
-            stream=self.stream,
-            temperature=self.temperature
-        )
-        result = response.choices[0].message.content
+        fields = {"prev_earnings_call": str(prev_earnings_call), "prev_financials": str(prev_earnings), "news_data": str(news_data)}
 
-        revenue, eps = parse_estimated_earnings(result)
+        earnings = self._complete(spec, fields)
+        revenue, eps = earnings["revenue"], earnings["eps"]
 
         df = pd.DataFrame([
             {
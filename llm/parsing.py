@@ -0,0 +1,141 @@
+import json
+import re
+
+from typing import Any
+
+
+def parse_price(text: str) -> dict[str, Any]:
+    match = re.search(r'###!PRICE!###\s*(\d+\.?\d*)', text)
+    if not match:
+        raise ValueError("Price not found or improperly formatted.")
+
+    return {"price": float(match.group(1))}
+
+
+def parse_sentiment(text: str) -> dict[str, Any]:
+    line = text.strip()
+    if not line.startswith("###!SENTIMENT!###"):
+        raise ValueError("Line does not start with '###!SENTIMENT!###'")
+
+    payload = line.replace("###!SENTIMENT!###", "").strip()
+    parts   = [p.strip() for p in payload.split("|")]
+
+    if len(parts) != 3:
+        raise ValueError("Expected exactly three fields separated by '|'")
+
+    score_str = parts[0]
+    if not re.fullmatch(r"-?\d+", score_str):
+        raise ValueError(f"Score is not an integer: {score_str}")
+
+    score       = int(score_str)
+    confidence  = parts[1].title()
+    reason      = parts[2]
+
+    if confidence not in {"High", "Medium", "Low"}:
+        raise ValueError(f"Confidence must be High, Medium, or Low (got {confidence})")
+
+    return {
+        "score": score,
+        "confidence": confidence,
+        "reason": reason,
+    }
+
+
+def parse_ticker(text: str) -> dict[str, Any]:
+    match = re.search(r'###!TICKER!###\s*([A-Z]{1,5})', text)
+    if not match:
+        raise ValueError("Ticker not found or improperly formatted.")
+
+    return {"ticker": match.group(1)}
+
+
+def parse_earnings(text: str) -> dict[str, Any]:
+    match = re.search(r"###EARNINGS###\s*(\d+)\s*\|\s*([0-9.]+)", text)
+    if not match:
+        raise ValueError("Earnings result not found or improperly formatted.")
+
+    return {"revenue": int(match.group(1)), "eps": float(match.group(2))}
+
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+}
+
+
+def validate(value: Any, schema: dict[str, Any], path: str = "$") -> Any:
+    """
+    Validate `value` against the small JSON Schema subset used by the output
+    schemas (type, properties, required, items, enum, minimum, maximum,
+    exclusiveMinimum, pattern) and return it with undeclared keys removed.
+    Raises ValueError describing the first violation.
+    """
+    expected = schema.get("type")
+
+    if expected is not None:
+        if isinstance(value, bool) or not isinstance(value, _JSON_TYPES[expected]):
+            # Models often return whole numbers as 12.0 or numbers as strings.
+            if expected == "integer" and isinstance(value, float) and value.is_integer():
+                value = int(value)
+            elif expected in ("integer", "number") and isinstance(value, str):
+                try:
+                    value = int(value) if expected == "integer" else float(value)
+                except ValueError:
+                    raise ValueError(f"{path}: expected {expected}, got {value!r}")
+            else:
+                raise ValueError(f"{path}: expected {expected}, got {type(value).__name__}")
+
+    if "enum" in schema and value not in schema["enum"]:
+        raise ValueError(f"{path}: {value!r} is not one of {schema['enum']}")
+
+    if "minimum" in schema and value < schema["minimum"]:
+        raise ValueError(f"{path}: {value} is below the minimum {schema['minimum']}")
+
+    if "maximum" in schema and value > schema["maximum"]:
+        raise ValueError(f"{path}: {value} is above the maximum {schema['maximum']}")
+
+    if "exclusiveMinimum" in schema and value <= schema["exclusiveMinimum"]:
+        raise ValueError(f"{path}: {value} must be greater than {schema['exclusiveMinimum']}")
+
+    if "pattern" in schema and not re.fullmatch(schema["pattern"], value):
+        raise ValueError(f"{path}: {value!r} does not match {schema['pattern']}")
+
+    if expected == "object":
+        properties = schema.get("properties", {})
+
+        for key in schema.get("required", []):
+            if key not in value:
+                raise ValueError(f"{path}: missing required field '{key}'")
+
+        value = {
+            key: validate(item, properties[key], f"{path}.{key}")
+            for key, item in value.items()
+            if key in properties
+        }
+
+    if expected == "array" and "items" in schema:
+        value = [validate(item, schema["items"], f"{path}[{i}]") for i, item in enumerate(value)]
+
+    return value
+
+
+def parse_json(text: str, schema: dict[str, Any]) -> dict[str, Any]:
+    """
+    Parse a JSON object from a model reply (tolerating surrounding prose or a
+    ```json fence) and validate it against `schema`.
+    """
+    start = text.find("{")
+    end = text.rfind("}")
+
+    if start == -1 or end < start:
+        raise ValueError("No JSON object found in the response.")
+
+    try:
+        value = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"Invalid JSON: {exc}")
+
+    return validate(value, schema)
@@ -0,0 +1,261 @@
+import os
+import random
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    """
+    One OpenAI-compatible endpoint: a hosted API key or a local model server.
+    `model` overrides the requested model name for servers that expose a
+    different one.
+    """
+    name: str
+    base_url: str
+    api_key: str = ""
+    model: str | None = None
+    weight: float = 1.0
+    max_concurrency: int = 10
+
+
+def _is_retryable(exc: Exception) -> bool:
+    """
+    Connection errors, timeouts, 408/409/429 and 5xx responses are worth
+    retrying (the same set the openai client retries); any other error,
+    such as a bad request or an authentication failure, would fail the same
+    way on every endpoint.
+    """
+    from openai import APIConnectionError, APIStatusError
+
+    if isinstance(exc, APIConnectionError):
+        return True
+
+    if isinstance(exc, APIStatusError):
+        return exc.status_code in (408, 409, 429) or exc.status_code >= 500
+
+    return isinstance(exc, (ConnectionError, TimeoutError))
+
+
+def _retry_after(exc: Exception) -> float | None:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class _EndpointState:
+    endpoint: Endpoint
+    client: Any = None
+    client_lock: threading.Lock = field(default_factory=threading.Lock)
+    outstanding: int = 0
+    requests: int = 0
+    errors: int = 0
+    consecutive_failures: int = 0
+    ejected_until: float = 0.0
+    # Whether the endpoint honours the `n` parameter; None until a request with n > 1.
+    supports_n: bool | None = None
+    latencies: deque = field(default_factory=lambda: deque(maxlen=1000))
+
+
+class EndpointRouter:
+    """
+    Routes chat completions across several endpoints. Each request goes to the
+    healthy endpoint with the fewest outstanding requests per unit of weight,
+    never exceeding an endpoint's `max_concurrency`. An endpoint that fails
+    `failure_threshold` times in a row is ejected for `eject_seconds`, and a
+    failed request is retried on another endpoint up to `max_attempts` times.
+
+    Only transient failures (see `_is_retryable`) are retried and count
+    towards ejection; other errors are raised at once. Retries wait an
+    exponential backoff starting at `backoff_seconds` (with jitter, capped
+    at `max_backoff_seconds`), or the server's `retry-after` if longer.
+    """
+
+    def __init__(
+        self,
+        endpoints: list[Endpoint],
+        max_attempts: int = 3,
+        failure_threshold: int = 3,
+        eject_seconds: float = 30.0,
+        backoff_seconds: float = 1.0,
+        max_backoff_seconds: float = 30.0,
+    ) -> None:
+        if not endpoints:
+            raise ValueError("At least one endpoint is required")
+
+        self._states = [_EndpointState(endpoint) for endpoint in endpoints]
+        self.max_attempts = max_attempts
+        self.failure_threshold = failure_threshold
+        self.eject_seconds = eject_seconds
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._condition = threading.Condition()
+
+    @classmethod
+    def from_env(cls) -> "EndpointRouter":
+        return cls([
+            Endpoint(
+                name="default",
+                base_url=os.getenv("DEEPSEEK_URL", ""),
+                api_key=os.getenv("OPENAI_API_KEY", ""),
+            )
+        ])
+
+    def _client(self, state: _EndpointState) -> Any:
+        # openai is slow to import, so clients are built on first request,
+        # under the endpoint's own lock so other requests are not held up.
+        with state.client_lock:
+            if state.client is None:
+                from openai import OpenAI
+
+                # The router owns retries and backoff, so the per-endpoint clients do not retry.
+                # Local model servers accept any key, but the client requires one.
+                state.client = OpenAI(api_key=state.endpoint.api_key or "EMPTY", base_url=state.endpoint.base_url, max_retries=0)
+
+            return state.client
+
+    def _select(self, tried: set[int], needs_n: bool = False) -> _EndpointState | None:
+        now = time.monotonic()
+
+        # Requests with n > 1 only go to endpoints not yet seen ignoring `n`
+        # (while there are any), so they are not spent on a single sample.
+        candidates = self._states
+        if needs_n:
+            candidates = [state for state in self._states if state.supports_n is not False] or self._states
+
+        # Prefer endpoints not yet tried for this request; reuse them only
+        # when every endpoint has been tried.
+        pool = [state for state in candidates if self._states.index(state) not in tried] or candidates
+
+        # If every endpoint in the pool is ejected, probe the one whose
+        # ejection ends first.
+        healthy = [state for state in pool if state.ejected_until <= now]
+        if not healthy:
+            healthy = [min(pool, key=lambda state: state.ejected_until)]
+
+        available = [state for state in healthy if state.outstanding < state.endpoint.max_concurrency]
+        if not available:
+            return None
+
+        return min(available, key=lambda state: (state.outstanding + 1) / state.endpoint.weight)
+
+    def _acquire(self, tried: set[int], needs_n: bool = False) -> _EndpointState:
+        with self._condition:
+            while (state := self._select(tried, needs_n)) is None:
+                self._condition.wait()
+
+            state.outstanding += 1
+            tried.add(self._states.index(state))
+
+            return state
+
+    def _release(self, state: _EndpointState, latency: float, failed: bool, rejected: bool = False) -> None:
+        with self._condition:
+            state.outstanding -= 1
+            state.requests += 1
+
+            if rejected:
+                state.errors += 1
+            elif failed:
+                state.errors += 1
+                state.consecutive_failures += 1
+
+                if state.consecutive_failures >= self.failure_threshold:
+                    state.ejected_until = time.monotonic() + self.eject_seconds
+                    print(f"[router] ejecting {state.endpoint.name} for {self.eject_seconds}s")
+            else:
+                state.consecutive_failures = 0
+                state.ejected_until = 0.0
+                state.latencies.append(latency)
+
+            self._condition.notify_all()
+
+    def _record_n_support(self, state: _EndpointState, supported: bool) -> None:
+        with self._condition:
+            if state.supports_n is None and not supported:
+                print(f"[router] {state.endpoint.name} ignores n, ensembles will be packed there")
+            state.supports_n = supported
+
+    def supports_n(self) -> bool:
+        """
+        False once every endpoint has been seen ignoring the `n` parameter.
+        """
+        with self._condition:
+            return any(state.supports_n is not False for state in self._states)
+
+    def create_chat_completion(self, **kwargs) -> Any:
+        """
+        Same arguments and return value as `client.chat.completions.create`.
+        """
+        tried: set[int] = set()
+        error = None
+
+        for attempt in range(self.max_attempts):
+            if error is not None:
+                delay = min(self.backoff_seconds * 2 ** (attempt - 1), self.max_backoff_seconds) * random.uniform(0.5, 1.0)
+                time.sleep(max(delay, min(_retry_after(error) or 0, self.max_backoff_seconds)))
+
+            state = self._acquire(tried, kwargs.get("n", 1) > 1)
+            request = dict(kwargs)
+
+            if state.endpoint.model:
+                request["model"] = state.endpoint.model
+
+            start = time.monotonic()
+            try:
+                response = self._client(state).chat.completions.create(**request)
+            except Exception as exc:
+                if not _is_retryable(exc):
+                    # The endpoint answered; the request itself is bad.
+                    self._release(state, time.monotonic() - start, failed=False, rejected=True)
+                    raise
+
+                self._release(state, time.monotonic() - start, failed=True)
+                print(f"[router] {state.endpoint.name} failed: {exc}")
+                error = exc
+                continue
+
+            self._release(state, time.monotonic() - start, failed=False)
+
+            if request.get("n", 1) > 1:
+                self._record_n_support(state, len(response.choices) >= request["n"])
+
+            return response
+
+        raise error
+
+    def report(self) -> pd.DataFrame:
+        """
+        Per-endpoint request counts, error rate, current load and latency.
+        """
+        now = time.monotonic()
+        rows = []
+
+        with self._condition:
+            for state in self._states:
+                latencies = np.array(state.latencies, dtype=float)
+
+                rows.append({
+                    "endpoint": state.endpoint.name,
+                    "requests": state.requests,
+                    "errors": state.errors,
+                    "error_rate": state.errors / state.requests if state.requests else None,
+                    "outstanding": state.outstanding,
+                    "ejected": state.ejected_until > now,
+                    "supports_n": state.supports_n,
+                    "mean_latency_s": float(latencies.mean()) if len(latencies) else None,
+                    "p95_latency_s": float(np.percentile(latencies, 95)) if len(latencies) else None,
+                })
+
+        return pd.DataFrame(rows)
@@ -0,0 +1,201 @@
+import numpy as np
+
+from typing import Any
+
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# Window sampling for walk-forward backtests. Every candidate window is
+# assigned to a volatility stratum (prices are free, model calls are not);
+# metrics are estimated from the sampled windows with the stratified mean,
+# so windows added adaptively to one stratum do not bias the estimate.
+
+
+def window_volatility(closes: np.ndarray, window_size: int) -> np.ndarray:
+    """
+    Standard deviation of daily log returns inside each window, for the
+    windows forecast_price_data lays out: window i covers closes
+    i - window_size .. i - 1, for i in window_size .. len(closes) - 1.
+    """
+    n = len(closes) - window_size
+    if n <= 0:
+        return np.empty(0)
+
+    returns = np.diff(np.log(np.asarray(closes, dtype=float)))
+    if window_size < 2:
+        return np.zeros(n)
+
+    return sliding_window_view(returns, window_size - 1)[:n].std(axis=1)
+
+
+def assign_strata(volatility: np.ndarray, n_strata: int = 3) -> np.ndarray:
+    """
+    Volatility quantile bin (0 = calmest) of every window.
+    """
+    if len(volatility) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    edges = np.quantile(volatility, np.linspace(0, 1, n_strata + 1)[1:-1])
+    return np.searchsorted(edges, volatility, side="right")
+
+
+def initial_sample(
+    strata: np.ndarray,
+    method: str = "stride",
+    stride: int = 5,
+    fraction: float = 0.1,
+    rng: np.random.Generator | None = None,
+    min_per_stratum: int = 2,
+) -> np.ndarray:
+    """
+    Positions of the first windows to evaluate: every `stride`-th window
+    (`method="stride"`) or a random `fraction` of each stratum
+    (`method="stratified"`). Either way every stratum gets at least
+    `min_per_stratum` windows so its variance can be estimated.
+    """
+    if method not in ("stride", "stratified"):
+        raise ValueError(f"Invalid sampling method: {method}")
+
+    rng = rng or np.random.default_rng()
+    taken = np.zeros(len(strata), dtype=bool)
+
+    if method == "stride":
+        taken[::stride] = True
+
+    for h in np.unique(strata):
+        members = np.flatnonzero(strata == h)
+        want = max(min_per_stratum, int(round(fraction * len(members)))) if method == "stratified" else min_per_stratum
+        missing = min(want, len(members)) - int(taken[members].sum())
+
+        if missing > 0:
+            taken[rng.choice(members[~taken[members]], size=missing, replace=False)] = True
+
+    return np.flatnonzero(taken)
+
+
+def _stratum_variances(
+    values: np.ndarray,
+    strata: np.ndarray,
+    n_strata: int,
+    pseudo: float | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sample size, mean and variance of the evaluated windows in each stratum.
+    With `pseudo`, the values are 0/1 and each stratum's variance is p(1 - p)
+    of its rate with `pseudo` successes and `pseudo` failures added, so a
+    stratum of all 0s or all 1s is not taken as certain.
+    """
+    observed = ~np.isnan(values)
+    pooled = float(np.var(values[observed], ddof=1)) if observed.sum() > 1 else 0.25
+
+    counts = np.zeros(n_strata)
+    means = np.zeros(n_strata)
+    variances = np.full(n_strata, 0.25 if pseudo is not None else pooled)
+
+    for h in range(n_strata):
+        vals = values[observed & (strata == h)]
+        counts[h] = len(vals)
+        if len(vals):
+            means[h] = vals.mean()
+        if pseudo is not None:
+            p = (vals.sum() + pseudo) / (len(vals) + 2 * pseudo)
+            variances[h] = p * (1 - p)
+        elif len(vals) > 1:
+            variances[h] = vals.var(ddof=1)
+
+    return counts, means, variances
+
+
+def stratified_estimate(
+    values: np.ndarray,
+    strata: np.ndarray,
+    z: float = 1.96,
+    bounds: tuple[float, float] | None = None,
+    binary: bool = False,
+) -> dict[str, Any]:
+    """
+    Stratified mean of `values` over all windows, from the windows evaluated
+    so far (NaN = not evaluated), with a normal-approximation confidence
+    interval including the finite population correction. Strata with no
+    evaluated window are left out and their weight spread over the rest.
+
+    For 0/1 metrics (`binary`), each stratum's variance is taken from its
+    rate with z^2/2 pseudo-successes and pseudo-failures added (as in the
+    Agresti-Coull interval), so strata that are all hits or all misses do
+    not collapse the interval to zero width. It is clipped to [0, 1] unless
+    other `bounds` are given.
+    """
+    n_strata = int(strata.max()) + 1 if len(strata) else 0
+    sizes = np.bincount(strata, minlength=n_strata).astype(float)
+    counts, means, variances = _stratum_variances(values, strata, n_strata, z ** 2 / 2 if binary else None)
+
+    covered = counts > 0
+    if not covered.any():
+        return {"estimate": None, "ci_low": None, "ci_high": None, "half_width": np.inf,
+                "n_sampled": 0, "n_windows": len(values)}
+
+    weights = sizes[covered] / sizes[covered].sum()
+    n, size = counts[covered], sizes[covered]
+
+    if binary:
+        bounds = bounds or (0.0, 1.0)
+
+    estimate = float((weights * means[covered]).sum())
+    variance = float((weights ** 2 * (1 - n / size) * variances[covered] / n).sum())
+    half_width = z * np.sqrt(variance)
+
+    low, high = estimate - half_width, estimate + half_width
+    if bounds is not None:
+        low, high = max(low, bounds[0]), min(high, bounds[1])
+
+    return {
+        "estimate": estimate,
+        "ci_low": float(low),
+        "ci_high": float(high),
+        "half_width": float(half_width),
+        "n_sampled": int(counts.sum()),
+        "n_windows": len(values),
+    }
+
+
+def next_batch(
+    values: np.ndarray,
+    strata: np.ndarray,
+    taken: np.ndarray,
+    batch_size: int,
+    rng: np.random.Generator | None = None,
+    binary: bool = False,
+) -> np.ndarray:
+    """
+    Pick up to `batch_size` more windows, one at a time, from the stratum
+    where one more evaluation shrinks the variance of the stratified mean
+    the most: strata with more spread in the metric (typically the volatile
+    ones) and fewer samples get more. Windows are drawn at random within a
+    stratum, which keeps the estimate unbiased. For 0/1 metrics (`binary`)
+    the variances use two pseudo-successes and two pseudo-failures per
+    stratum, so strata that are all hits or all misses still get windows.
+    """
+    rng = rng or np.random.default_rng()
+    n_strata = int(strata.max()) + 1 if len(strata) else 0
+
+    sizes = np.bincount(strata, minlength=n_strata).astype(float)
+    left = np.bincount(strata[~taken], minlength=n_strata)
+    # Failed evaluations (NaN) do not count, so their strata get topped up.
+    counts = np.bincount(strata[taken & ~np.isnan(values)], minlength=n_strata).astype(float)
+    _, _, variances = _stratum_variances(values, strata, n_strata, 2.0 if binary else None)
+
+    weights = sizes / sizes.sum() if sizes.sum() else sizes
+    extra = np.zeros(n_strata, dtype=np.int64)
+
+    for _ in range(min(batch_size, int(left.sum()))):
+        n = np.maximum(counts + extra, 1)
+        gain = weights ** 2 * variances * (1 / n - 1 / (n + 1))
+        gain[extra >= left] = -np.inf
+        extra[int(np.argmax(gain))] += 1
+
+    picked = [
+        rng.choice(np.flatnonzero((strata == h) & ~taken), size=k, replace=False)
+        for h, k in enumerate(extra) if k
+    ]
+
+    return np.sort(np.concatenate(picked)) if picked else np.empty(0, dtype=np.int64)
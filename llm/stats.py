@@ -0,0 +1,36 @@
+import threading
+import pandas as pd
+
+from collections import defaultdict
+
+
+class PipelineStats:
+    """
+    Thread-safe counters keyed by pipeline (e.g. "NEWS", "PRICE") and counter
+    name, shared by every worker thread of one LLMForFinance instance.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+    def increment(self, pipeline: str, counter: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counters[pipeline][counter] += amount
+
+    def get(self, pipeline: str, counter: str) -> float:
+        with self._lock:
+            return self._counters.get(pipeline, {}).get(counter, 0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+
+    def report(self) -> pd.DataFrame:
+        with self._lock:
+            data = {pipeline: dict(counters) for pipeline, counters in self._counters.items()}
+
+        df = pd.DataFrame.from_dict(data, orient="index").fillna(0)
+        df.index.name = "pipeline"
+
+        return df.sort_index()
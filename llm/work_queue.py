@@ -0,0 +1,437 @@
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import pandas as pd
+
+from contextlib import contextmanager
+from dataclasses import asdict
+from io import StringIO
+from typing import Any
+
+from llm.router import Endpoint
+
+
+# Queue task name -> LLMForFinance method run for each unit.
+TASKS = {
+    "forecast": "forecast_price_data",
+    "sentiment": "analyze_ticker_sentiments",
+    "estimate_ticker": "estimate_stock_ticker",
+    "earnings": "estimate_ticker_earnings",
+}
+
+# Tasks that walk a ticker's price windows and accept `after_date`, so they
+# can be split into chunks of windows with enqueue_windows.
+WINDOWED_TASKS = ("forecast", "estimate_ticker")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS units (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    task          TEXT NOT NULL,
+    ticker        TEXT NOT NULL,
+    start_date    TEXT NOT NULL DEFAULT '',
+    end_date      TEXT NOT NULL DEFAULT '',
+    params        TEXT NOT NULL DEFAULT '{}',
+    status        TEXT NOT NULL DEFAULT 'pending',
+    worker        TEXT,
+    lease_expires REAL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    result        TEXT,
+    error         TEXT,
+    UNIQUE (task, ticker, start_date, end_date, params)
+);
+CREATE TABLE IF NOT EXISTS config (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+)
+"""
+
+# LLMForFinance options a coordinator can store for its workers (see
+# WorkQueue.save_model_config).
+MODEL_OPTIONS = (
+    "model", "temperature", "stream", "max_workers", "json_mode", "max_repairs",
+    "endpoints", "ensemble_mode", "ensemble_temperature", "cache_friendly_prompts",
+    "compact_data",
+)
+
+
+def _api_key(endpoint_name: str) -> str:
+    env_name = "".join(c if c.isalnum() else "_" for c in endpoint_name.upper()) + "_API_KEY"
+    return os.getenv(env_name, os.getenv("OPENAI_API_KEY", ""))
+
+
+class WorkQueue:
+    """
+    SQLite-backed queue of (task, ticker, date range) units with leases.
+
+    A coordinator enqueues units, one per ticker (enqueue) or one per chunk
+    of price windows (enqueue_windows); any number of worker processes, on this
+    machine or others sharing the file, claim them. A claim is a lease of
+    `lease_seconds` that the worker extends with heartbeats; units whose
+    lease expires (the worker crashed or hung) are handed to the next
+    claimant, up to `max_attempts` claims per unit.
+
+    The database uses SQLite's default rollback journal rather than WAL,
+    because WAL does not work on network file systems.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 300, max_attempts: int = 3) -> None:
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # Closing the connection rolls back any transaction left open by an error.
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(
+        self,
+        task: str,
+        tickers: list[str],
+        start_date: str | None = None,
+        end_date: str | None = None,
+        **params,
+    ) -> int:
+        """
+        Add one unit per ticker; `params` are passed to the task method as
+        keyword arguments. Units already in the queue are skipped. Returns the
+        number of units added.
+        """
+        if task not in TASKS:
+            raise ValueError(f"Unknown task: {task}")
+
+        rows = [
+            (task, ticker, start_date or "", end_date or "", json.dumps(params, sort_keys=True))
+            for ticker in tickers
+        ]
+
+        return self._insert(rows)
+
+    def enqueue_windows(
+        self,
+        task: str,
+        price_extractor,
+        tickers: list[str],
+        start_date: str,
+        end_date: str,
+        window_size: int = 30,
+        chunk_size: int = 20,
+        **params,
+    ) -> int:
+        """
+        Like enqueue for the windowed tasks, but one unit per `chunk_size`
+        consecutive windows of each ticker (`chunk_size=1` for one unit per
+        window), so a crashed worker only re-runs one chunk and one ticker's
+        windows can spread over many workers.
+
+        Every chunk runs the task from `start_date` to the chunk's last target
+        date with `after_date` set to skip earlier windows, so the windows line
+        up with a single run over the whole range.
+        """
+        if task not in WINDOWED_TASKS:
+            raise ValueError(f"Task {task} cannot be split into windows")
+
+        rows = []
+
+        for ticker in tickers:
+            dates = sorted(price_extractor.extract_ticker_price(ticker, start_date, end_date)["date"].astype(str))
+
+            # Window i covers dates[i - window_size .. i - 1] and forecasts dates[i].
+            for first in range(window_size, len(dates), chunk_size):
+                last = min(first + chunk_size, len(dates)) - 1
+
+                unit_params = dict(params, window_size=window_size)
+                if first > window_size:
+                    unit_params["after_date"] = dates[first - 2]
+
+                rows.append((task, ticker, start_date, dates[last], json.dumps(unit_params, sort_keys=True)))
+
+        return self._insert(rows)
+
+    def _insert(self, rows: list[tuple]) -> int:
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT OR IGNORE INTO units (task, ticker, start_date, end_date, params) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+            return conn.total_changes - before
+
+    def claim(self, worker: str) -> dict[str, Any] | None:
+        """
+        Lease the next pending (or lease-expired) unit to `worker`, or return
+        None if there is nothing to do right now.
+        """
+        now = time.time()
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+
+            conn.execute(
+                "UPDATE units SET status = 'failed', error = 'lease expired' "
+                "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            )
+
+            row = conn.execute(
+                "SELECT * FROM units "
+                "WHERE status = 'pending' OR (status = 'leased' AND lease_expires < ?) "
+                "ORDER BY id LIMIT 1",
+                (now,),
+            ).fetchone()
+
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                "UPDATE units SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                (worker, now + self.lease_seconds, row["id"]),
+            )
+            conn.execute("COMMIT")
+
+        unit = dict(row)
+        unit["params"] = json.loads(unit["params"])
+
+        return unit
+
+    def heartbeat(self, unit_id: int, worker: str) -> bool:
+        """
+        Extend the lease; False means the lease was lost to another worker.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE units SET lease_expires = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (time.time() + self.lease_seconds, unit_id, worker),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, unit_id: int, worker: str, result: pd.DataFrame) -> bool:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE units SET status = 'done', result = ?, error = NULL "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (result.to_json(orient="records", date_format="iso"), unit_id, worker),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, unit_id: int, worker: str, error: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE units SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = ?, lease_expires = NULL "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (self.max_attempts, error, unit_id, worker),
+            )
+
+    def save_model_config(self, model=None, **options) -> None:
+        """
+        Store the LLMForFinance options workers should build their model with:
+        those of `model` (the coordinator's own instance), updated by `options`.
+
+        API keys are not written to the queue file; workers read each
+        endpoint's key from the {NAME}_API_KEY environment variable, falling
+        back to OPENAI_API_KEY.
+        """
+        config = {name: getattr(model, name) for name in MODEL_OPTIONS} if model is not None else {}
+        config.update(options)
+
+        unknown = set(config) - set(MODEL_OPTIONS)
+        if unknown:
+            raise ValueError(f"Unknown model options: {sorted(unknown)}")
+
+        if config.get("endpoints"):
+            config["endpoints"] = [
+                {**asdict(endpoint), "api_key": ""} for endpoint in config["endpoints"]
+            ]
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM config")
+            conn.executemany(
+                "INSERT INTO config (key, value) VALUES (?, ?)",
+                [(key, json.dumps(value)) for key, value in config.items()],
+            )
+            conn.execute("COMMIT")
+
+    def model_config(self) -> dict[str, Any]:
+        """
+        LLMForFinance keyword arguments stored by save_model_config, with the
+        endpoints rebuilt and their API keys read from the environment.
+        """
+        with self._connect() as conn:
+            rows = conn.execute("SELECT key, value FROM config").fetchall()
+
+        config = {row["key"]: json.loads(row["value"]) for row in rows}
+
+        if config.get("endpoints"):
+            config["endpoints"] = [
+                Endpoint(**{**endpoint, "api_key": _api_key(endpoint["name"])})
+                for endpoint in config["endpoints"]
+            ]
+
+        return config
+
+    def progress(self) -> dict[str, int]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM units GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def results(self, task: str) -> pd.DataFrame:
+        """
+        Concatenated results of all finished units of `task`, tagged by ticker.
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT ticker, result FROM units WHERE task = ? AND status = 'done' ORDER BY id",
+                (task,),
+            ).fetchall()
+
+        frames = []
+        for row in rows:
+            df = pd.read_json(StringIO(row["result"]), orient="records")
+            df["ticker"] = row["ticker"]
+            frames.append(df)
+
+        if not frames:
+            return pd.DataFrame()
+
+        df = pd.concat(frames, ignore_index=True)
+
+        if task in WINDOWED_TASKS and "last_date" in df:
+            # Each chunk guessed the estimated_date of its last window; the
+            # next chunk's first window gives the actual one.
+            df["last_date"] = pd.to_datetime(df["last_date"])
+            df = df.sort_values(["ticker", "last_date"], ignore_index=True)
+            df["estimated_date"] = df.groupby("ticker")["last_date"].shift(-1)
+            missing = df["estimated_date"].isna()
+            df.loc[missing, "estimated_date"] = df.loc[missing, "last_date"] + pd.offsets.BDay(1)
+
+        return df
+
+
+def run_unit(model, unit: dict[str, Any]) -> pd.DataFrame:
+    kwargs = dict(unit["params"])
+
+    if unit["start_date"]:
+        kwargs["start_date"] = unit["start_date"]
+    if unit["end_date"]:
+        kwargs["end_date"] = unit["end_date"]
+
+    return getattr(model, TASKS[unit["task"]])(unit["ticker"], **kwargs)
+
+
+def run_worker(
+    path: str,
+    worker: str | None = None,
+    lease_seconds: float = 300,
+    max_attempts: int = 3,
+    poll_seconds: float = 5,
+    exit_when_idle: bool = True,
+    **model_kwargs,
+) -> int:
+    """
+    Claim and run units until the queue has nothing left to lease (or forever
+    when `exit_when_idle` is False). Returns the number of units completed.
+
+    The model is built with the options the coordinator stored with
+    save_model_config, overridden by `model_kwargs`.
+    """
+    from llm.deep_seek import LLMForFinance
+
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    queue = WorkQueue(path, lease_seconds, max_attempts)
+    model = LLMForFinance(**{**queue.model_config(), **model_kwargs})
+    completed = 0
+
+    while True:
+        unit = queue.claim(worker)
+
+        if unit is None:
+            progress = queue.progress()
+            if exit_when_idle and not progress.get("pending") and not progress.get("leased"):
+                break
+            time.sleep(poll_seconds)
+            continue
+
+        print(f"[{worker}] unit {unit['id']}: {unit['task']} {unit['ticker']} (attempt {unit['attempts'] + 1})")
+
+        stop = threading.Event()
+
+        def beat(unit_id: int = unit["id"]) -> None:
+            while not stop.wait(lease_seconds / 3):
+                if not queue.heartbeat(unit_id, worker):
+                    print(f"[{worker}] lost lease on unit {unit_id}")
+                    return
+
+        heart = threading.Thread(target=beat, daemon=True)
+        heart.start()
+
+        try:
+            result = run_unit(model, unit)
+        except Exception as exc:
+            print(f"[{worker}] unit {unit['id']} failed: {exc}")
+            queue.fail(unit["id"], worker, repr(exc))
+        else:
+            if queue.complete(unit["id"], worker, result):
+                completed += 1
+        finally:
+            stop.set()
+            heart.join()
+
+    return completed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run or inspect an LLMForFinance work queue.")
+    parser.add_argument("command", choices=["worker", "status"])
+    parser.add_argument("path", help="SQLite queue file")
+    parser.add_argument("--worker-id", default=None)
+    parser.add_argument("--lease-seconds", type=float, default=300)
+    parser.add_argument("--wait", action="store_true", help="keep polling when the queue is empty")
+
+    # Model options; any left unset come from the queue's stored config, then the defaults.
+    parser.add_argument("--max-workers", type=int, help="threads per worker process")
+    parser.add_argument("--model")
+    parser.add_argument("--temperature", type=float)
+    parser.add_argument("--json-mode", action=argparse.BooleanOptionalAction, default=None)
+    parser.add_argument("--ensemble-mode", choices=["auto", "n", "packed"])
+    parser.add_argument("--cache-friendly-prompts", action=argparse.BooleanOptionalAction, default=None)
+    parser.add_argument("--compact-data", action=argparse.BooleanOptionalAction, default=None)
+    parser.add_argument("--endpoint", action="append", metavar="NAME=BASE_URL",
+                        help="route to this endpoint (repeatable); its key is read from NAME_API_KEY")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        print(WorkQueue(args.path).progress())
+    else:
+        model_kwargs = {
+            name: getattr(args, name)
+            for name in ("max_workers", "model", "temperature", "json_mode", "ensemble_mode",
+                         "cache_friendly_prompts", "compact_data")
+            if getattr(args, name) is not None
+        }
+        if args.endpoint:
+            model_kwargs["endpoints"] = [
+                Endpoint(name=name, base_url=url, api_key=_api_key(name))
+                for name, url in (spec.split("=", 1) for spec in args.endpoint)
+            ]
+
+        done = run_worker(args.path, args.worker_id, args.lease_seconds,
+                          exit_when_idle=not args.wait, **model_kwargs)
+        print(f"completed {done} units")
@@ -1,32 +1,34 @@
 import pandas as pd
-from extractor.price_extractor import PriceExtractor
-from extractor.news_extractor import NewsExtractor
-from extractor.earnings_call_extractor import EarningsCallExtractor
-from extractor.financial_statement_extractor import FinancialStatementExtractor
+from extractor.universe_extractor import UniverseExtractor
 
 from llm.deep_seek import LLMForFinance
+from llm.work_queue import WorkQueue
 from llm import *
 
 if __name__ == "__main__":
-    price_extractor = PriceExtractor()
-    news_extractor = NewsExtractor()
-    earnings_call_extractor = EarningsCallExtractor()
-    financial_statement_extractor = FinancialStatementExtractor()
+    # Extractors and the API client are built lazily on first use, so only
+    # pass the universe the datasets this run actually filters on.
+    model = LLMForFinance()
+
+    universe = UniverseExtractor(
+        price_extractor=model.price_extractor,
+        financial_statement_extractor=model.financial_statement_extractor,
+    )
 
-    # print(earnings_call_extractor.get_previous_quarters_transcripts_json('AAPL', 2025, 'Q1'))
+    # print(model.earnings_extractor.get_previous_quarters_transcripts_json('AAPL', 2025, 'Q1'))
 
-    # print(financial_statement_extractor.get_previous_quarters_statements_json('PYPL', 2024, 'Q4', 2))
+    # print(model.financial_statement_extractor.get_previous_quarters_statements_json('PYPL', 2024, 'Q4', 2))
     
-    # price_universe = price_extractor.show_universe(start_date="2024-02-20", end_date="2025-02-14", min_cnt=50)
+    # price_universe = model.price_extractor.show_universe(start_date="2024-02-20", end_date="2025-02-14", min_cnt=50)
     
-    # # print(news_extractor.extract_news("PYPL", "2024-10-02", "2025-01-30"))
+    # # print(model.news_extractor.extract_news("PYPL", "2024-10-02", "2025-01-30"))
 
-    # news_universe = news_extractor.show_universe(start_date="2024-02-20", end_date="2025-02-14", min_cnt=None)
+    # news_universe = model.news_extractor.show_universe(start_date="2024-02-20", end_date="2025-02-14", min_cnt=None)
     # news_tickers = [data['ticker'] for data in news_universe]
 
-    # # # print(price_extractor.ticker_statistics('PYPL',start_date="2024-02-20", end_date="2025-02-14"))
+    # news_tickers = universe.get_tickers(start_date="2024-02-20", end_date="2025-02-14", min_price_days=50, min_news_days=1)
 
-    model = LLMForFinance()
+    # # # print(model.price_extractor.ticker_statistics('PYPL',start_date="2024-02-20", end_date="2025-02-14"))
 
     # # prediction = model.forecast_price_data('PYPL', "2024-10-21", "2025-01-30")
     # # prediction.to_csv('PYPL_FORECAST_2024102120250130.csv', index=False)
@@ -43,8 +45,19 @@ if __name__ == "__main__":
     # data = model.estimate_stock_ticker('PYPL', '2024-10-20', '2025-02-14')
     # data = model.estimate_tickers(news_tickers, '2024-02-20', '2025-02-14')
 
+    # # exploratory backtest on every 5th window, refined until accuracy is known to +/- 5%
+    # data, summary = model.sample_forecast_backtest(tickers, '2024-02-20', '2025-02-14', stride=5, target_half_width=0.05)
+    # data, summary = model.sample_ticker_backtest(tickers, '2024-02-20', '2025-02-14', method='stratified', fraction=0.05)
+    # print(summary)
+
+    # queue = WorkQueue('forecast_queue.sqlite')
+    # queue.enqueue_windows('forecast', model.price_extractor, news_tickers, '2024-02-20', '2025-02-14', window_size=30, chunk_size=20)
+    # queue.save_model_config(model)  # workers build their model with these options
+    # # then start workers anywhere the file is shared: python -m llm.work_queue worker forecast_queue.sqlite
+    # queue.results('forecast').to_csv('ALL_FORECAST.csv', index=False)
+
     
-    tickers = financial_statement_extractor.get_tickers()
+    tickers = universe.get_tickers(start_date="2024-02-20", end_date="2025-02-14", min_price_days=50, min_quarters=2)
     
     earnings_estimate = []
 
@@ -54,5 +67,7 @@ if __name__ == "__main__":
     res_df = pd.concat(earnings_estimate)
     res_df.to_csv('EARNINGS_EST.csv', index=False)
 
+    print(model.startup_report())
+
 
     # data.to_csv('TICKER_ESTIMATE_PRICE.csv', index=False)